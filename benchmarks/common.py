@@ -0,0 +1,61 @@
+import os
+import random
+import datetime
+import tempfile
+from contextlib import contextmanager
+from timeit import default_timer
+
+from peewee import SqliteDatabase
+
+from work_log.models import initialize, Task
+
+NAMES = ["employee{}".format(n) for n in range(500)]
+WORDS = ["report", "meeting", "bugfix", "review", "deploy", "notes", "client",
+         "database", "invoice", "design", "javascript", "todo", "letter"]
+START_DATE = datetime.date(2015, 1, 1)
+
+
+def synthetic_tasks(count, seed=0):
+    """yields reproducible task rows for benchmarking"""
+    rand = random.Random(seed)
+    for _ in range(count):
+        yield {
+            "name": rand.choice(NAMES),
+            "notes": " ".join(rand.choice(WORDS) for _ in range(8)),
+            "minutes": rand.randint(1, 32) * 15,
+            "timestamp": START_DATE + datetime.timedelta(days=rand.randint(0, 1500)),
+        }
+
+
+@contextmanager
+def synthetic_database(count, seed=0):
+    """creates a temporary database holding count synthetic tasks"""
+    handle, path = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
+    database = SqliteDatabase(path)
+    try:
+        initialize(database, profile="performance")
+        rows = synthetic_tasks(count, seed)
+        with database.atomic():
+            while True:
+                batch = [row for _, row in zip(range(5000), rows)]
+                if not batch:
+                    break
+                Task.insert_many(batch).execute()
+        yield database
+    finally:
+        database.close()
+        os.remove(path)
+
+
+def timed(func, *args, repeat=5):
+    """returns the best wall time of func(*args) in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = default_timer()
+        result = func(*args)
+        if hasattr(result, '__iter__'):
+            list(result)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Diffs two benchmark suite results and flags regressions.
+
+    python -m benchmarks.compare before.json after.json [--threshold 1.2]
+
+Exits with status 1 if any measurement got worse by more than threshold.
+"""
+import sys
+import json
+import argparse
+
+# metric name -> whether a bigger value is better
+METRICS = {
+    "seconds": False,
+    "peak_bytes": False,
+    "rows_per_second": True,
+}
+
+
+def compare(before, after, threshold):
+    """yields (size, benchmark, metric, before, after, ratio, regressed)"""
+    for size, benchmarks in sorted(after["results"].items(), key=lambda item: int(item[0])):
+        for name, measurements in sorted(benchmarks.items()):
+            old = before["results"].get(size, {}).get(name, {})
+            for metric, bigger_is_better in METRICS.items():
+                if metric not in measurements or not old.get(metric):
+                    continue
+                ratio = measurements[metric] / old[metric]
+                worse = 1 / ratio if bigger_is_better and ratio else ratio
+                yield size, name, metric, old[metric], measurements[metric], ratio, worse > threshold
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="ratio beyond which a change counts as a regression")
+    args = parser.parse_args(argv)
+    with open(args.before) as before, open(args.after) as after:
+        rows = list(compare(json.load(before), json.load(after), args.threshold))
+
+    for size, name, metric, old, new, ratio, regressed in rows:
+        print("{:>9} {:<20} {:<16} {:>14.6g} {:>14.6g} {:>7.2f}x{}".format(
+            size, name, metric, old, new, ratio, "  REGRESSION" if regressed else ""))
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
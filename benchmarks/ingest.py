@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Compares rows/sec of CREATE_TASK called per row against CREATE_TASKS.
+
+    python -m benchmarks.ingest [rows]
+"""
+import sys
+from timeit import default_timer
+
+from work_log.models import CREATE_TASK, CREATE_TASKS
+
+from .common import synthetic_database, synthetic_tasks
+
+
+def per_row(rows):
+    for row in rows:
+        CREATE_TASK(row)
+
+def bulk(rows):
+    CREATE_TASKS(rows)
+
+
+def main(rows=20000):
+    for label, ingest in [("CREATE_TASK per row", per_row), ("CREATE_TASKS", bulk)]:
+        with synthetic_database(0):
+            start = default_timer()
+            ingest(synthetic_tasks(rows))
+            elapsed = default_timer() - start
+        print("  {:<20} {:>10.0f} rows/sec".format(label, rows / elapsed))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
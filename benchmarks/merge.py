@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""Times merging two copies of the same synthetic work log into an empty
+one, the second copy being all duplicates, and the peak memory it takes.
+
+    python -m benchmarks.merge [rows ...]
+"""
+import sys
+import tracemalloc
+from timeit import default_timer
+
+from work_log.models import merge
+
+from .common import synthetic_database
+
+
+def measure(paths):
+    """merges paths into an empty database untraced for the time, then into
+    another traced for the peak memory"""
+    with synthetic_database(0):
+        start = default_timer()
+        results = merge(paths)
+        elapsed = default_timer() - start
+    with synthetic_database(0):
+        tracemalloc.start()
+        merge(paths)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return results, elapsed, peak
+
+
+def main(*sizes):
+    for size in sizes or (100000, 1000000):
+        with synthetic_database(size) as first, synthetic_database(size) as second:
+            results, elapsed, peak = measure([first.database, second.database])
+        print("{} rows per source".format(size))
+        for (merged, skipped), label in zip(results.values(), ["new", "duplicate"]):
+            print("  {:<10} {:>9} merged {:>9} skipped".format(label, merged, skipped))
+        print("  {:>8.0f} rows/sec {:>8.1f} MiB peak".format(2 * size / elapsed, peak / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
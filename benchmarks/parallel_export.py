@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Times a csv export of every task in one process against the same export
+split across 2, 4 and 8 worker processes.
+
+    python -m benchmarks.parallel_export [rows] [workers ...]
+
+Speedups need as many free cores as workers; on fewer the extra workers
+only add their start-up and merge costs.
+"""
+import os
+import sys
+
+from work_log.cli import write_csv
+from work_log.models import TASKS_MATCHING
+from work_log.parallel import write_parallel
+
+from .common import synthetic_database, timed
+
+
+def serial(out):
+    write_csv(TASKS_MATCHING(), out)
+
+def parallel(path, workers, out):
+    write_parallel(path, {}, write_csv, out, workers)
+
+
+def main(rows=10000000, *workers):
+    print("{} rows, {} cores".format(rows, os.cpu_count()))
+    with synthetic_database(rows) as database, open(os.devnull, "w") as out:
+        baseline = timed(serial, out, repeat=1)
+        print("  {:<10} {:>8.2f}s".format("1 process", baseline))
+        for count in workers or (2, 4, 8):
+            elapsed = timed(parallel, database.database, count, out, repeat=1)
+            print("  {:<10} {:>8.2f}s {:>6.2f}x".format(
+                "{} workers".format(count), elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
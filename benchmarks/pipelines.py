@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Compares the per-run overhead of menu option pipelines: the reduce over
+kwargs-splatting steps that options used to rebuild on every run, against
+compiled pipelines of keyword steps and of context steps.
+
+    python -m benchmarks.pipelines [steps ...]
+
+Steps do no work, so the times are the cost of chaining them alone.
+"""
+import sys
+from functools import partial, reduce
+
+from work_log.menuize import compile_option, context_step, normalize_func_list
+from work_log.profiling import timed_step
+
+from .common import timed
+
+RUNS = 10000
+# a context of the size options carry by the time they print
+CONTEXT = {key: key for key in ["title", "prompt", "name", "item_template", "alert"]}
+
+
+def keyword_step(*args, **kwargs):
+    return kwargs
+
+@context_step
+def context_in_place(context):
+    pass
+
+def choose(**kwargs):
+    kwargs['branch'] = branch
+    return kwargs
+
+def branch():
+    return [keyword_step]
+
+
+def old_merge_option_branch(option_branch, kwargs):
+    func_list = kwargs['func_list_factory']()
+    wild_idx = func_list.index("*")
+    func_list[wild_idx:wild_idx + 1] = option_branch
+    kwargs['func_list'][:] = func_list
+    return kwargs
+
+def old_choose(**kwargs):
+    return old_merge_option_branch(branch(), kwargs)
+
+def old_executor(*args, **kwargs):
+    def inner(acc, cur):
+        if acc.__class__.__name__ in ['function', 'partial', 'Mock']:
+            acc = timed_step(acc, *args, **kwargs)
+        return timed_step(cur, **acc)
+    return inner
+
+def old_option(chain_function, this):
+    """the option runner before pipelines were compiled"""
+    factory = partial(normalize_func_list, this=this, chain_function=chain_function)
+    kwargs = dict(CONTEXT, func_list_factory=factory, func_list=factory())
+    return reduce(old_executor(**kwargs), kwargs['func_list'])
+
+
+def chain(step, choice, steps):
+    """an option of steps around a choice, like search_tasks_func_list"""
+    def chain_function():
+        return [step] * (steps // 2) + [choice, "*", "this"] + [step] * (steps // 2)
+    return chain_function
+
+def runs(run):
+    for _ in range(RUNS):
+        run()
+
+
+def main(*sizes):
+    for steps in sizes or (4, 8, 16):
+        before = chain(keyword_step, old_choose, steps)
+        keyword = chain(keyword_step, choose, steps)
+        context = chain(context_in_place, choose, steps)
+        timings = [
+            ("before", timed(runs, lambda: old_option(before, keyword_step))),
+            ("keyword", timed(runs, lambda: compile_option(keyword, keyword_step).run(dict(CONTEXT)))),
+            ("context", timed(runs, lambda: compile_option(context, keyword_step).run(dict(CONTEXT)))),
+        ]
+        print("{} steps".format(steps))
+        for name, elapsed in timings:
+            print("  {:<8} {:>8.2f} us/run".format(name, elapsed / RUNS * 1e6))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Compares query plans and timings of the models helpers with and without
+the Task indexes.
+
+    python -m benchmarks.query_plans [rows]
+"""
+import sys
+import datetime
+
+from work_log.models import (explain, ALL_NAMES, ALL_DATES, TASKS_WITH_NAME,
+                            TASKS_WITH_DATE, TASKS_WITH_DURATION, TASKS_LASTING)
+
+from .common import synthetic_database, timed, NAMES, START_DATE
+
+HELPERS = [
+    (ALL_NAMES, ()),
+    (ALL_DATES, ()),
+    (TASKS_WITH_NAME, (NAMES[0],)),
+    (TASKS_WITH_DATE, (START_DATE + datetime.timedelta(days=30),)),
+    (TASKS_WITH_DURATION, (240,)),
+    (TASKS_LASTING, (240, 300)),
+]
+
+
+def report(label):
+    print(label)
+    for helper, args in HELPERS:
+        # time the queries themselves rather than the result cache
+        helper = getattr(helper, 'uncached', helper)
+        print("  {:<22} {:>9.2f} ms  {}".format(
+            helper.__name__,
+            timed(helper, *args) * 1000,
+            " / ".join(explain(helper(*args)))
+        ))
+
+
+def main(rows=200000):
+    with synthetic_database(rows) as database:
+        database.execute_sql('ANALYZE')
+        report("indexed ({} rows)".format(rows))
+        for index in database.get_indexes('task'):
+            database.execute_sql('DROP INDEX "{}"'.format(index.name))
+        # reconnect so no statement prepared against the old schema is reused
+        database.close()
+        database.connect()
+        report("unindexed ({} rows)".format(rows))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Compares peak memory and time of materializing every task as dicts,
+namedtuples and plain tuples.
+
+    python -m benchmarks.rows [rows ...]
+"""
+import sys
+import tracemalloc
+
+from work_log.models import ALL_TASKS, ROW_TYPES
+
+from .common import synthetic_database, timed
+
+
+def materialize(row_type):
+    return list(ALL_TASKS(row_type=row_type))
+
+def measure(row_type):
+    """returns the best time untraced, then the peak of one traced run"""
+    elapsed = timed(materialize, row_type, repeat=3)
+    tracemalloc.start()
+    materialize(row_type)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(*sizes):
+    for size in sizes or (10000, 100000, 1000000):
+        print("{} rows".format(size))
+        with synthetic_database(size):
+            for row_type in ROW_TYPES:
+                elapsed, peak = measure(row_type)
+                print("  {:<12} {:>8.3f}s {:>10.1f} MiB peak".format(
+                    row_type, elapsed, peak / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
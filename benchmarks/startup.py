@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Measures how long run.py takes to start and answer a small query, and
+fails if the median goes over a budget.
+
+    python -m benchmarks.startup [--runs 20] [--budget-ms 150]
+
+It also runs the same command under `python -X importtime` and lists
+the slowest imports.
+"""
+import os
+import sys
+import argparse
+import tempfile
+import statistics
+import subprocess
+from timeit import default_timer
+
+RUN_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "run.py")
+
+
+def command(database):
+    return [sys.executable, RUN_PY, "--database", database, "search", "--name", "nobody"]
+
+def wall_times(database, runs):
+    times = []
+    for _ in range(runs):
+        start = default_timer()
+        subprocess.run(command(database), check=True, stdout=subprocess.DEVNULL)
+        times.append(default_timer() - start)
+    return times
+
+def import_times(database):
+    """returns (self_us, cumulative_us, module) for each import, slowest first"""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + command(database)[1:],
+                            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, 
+                            text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(own), int(cumulative), module.rstrip()))
+    return sorted(rows, reverse=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=150)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, "startup.db")
+    try:
+        # the first run builds the schema; the ones timed find it current
+        subprocess.run(command(database), check=True, stdout=subprocess.DEVNULL)
+        times = wall_times(database, args.runs)
+        imports = import_times(database)
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    print("slowest imports (self / cumulative ms):")
+    for own, cumulative, module in imports[:10]:
+        print("  {:>7.1f} {:>7.1f}  {}".format(own / 1000, cumulative / 1000, module.strip()))
+    median = statistics.median(times) * 1000
+    print("startup: median {:.1f} ms, min {:.1f} ms over {} runs (budget {:.0f} ms)".format(
+        median, min(times) * 1000, len(times), args.budget_ms))
+    if median > args.budget_ms:
+        sys.exit("over budget")
+
+
+if __name__ == '__main__':
+    main()
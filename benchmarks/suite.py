@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Times the models helpers, task creation and list rendering against
+synthetic databases and writes the results as JSON.
+
+    python -m benchmarks.suite --rows 10000 100000 --output results.json
+    python -m benchmarks.compare before.json after.json
+
+Sizes of 1M and 10M rows work too, but building them takes a while.
+"""
+import sys
+import json
+import platform
+import argparse
+import datetime
+import subprocess
+import tracemalloc
+from timeit import default_timer
+
+from peewee import sqlite3
+
+from work_log import models
+from work_log.menuize import list_string
+from work_log.work_log import templates
+
+from .common import synthetic_database, synthetic_tasks, NAMES, START_DATE
+
+
+def day(offset):
+    return START_DATE + datetime.timedelta(days=offset)
+
+def helper_cases(rows):
+    """returns (name, function, args) for every models helper worth timing"""
+    return [
+        ("ALL_TASKS", models.ALL_TASKS, ()),
+        ("ALL_NAMES", models.ALL_NAMES.uncached, ()),
+        ("NAMES_MATCHING", models.NAMES_MATCHING.uncached, ("employee1",)),
+        ("NAMES_STARTING", models.NAMES_STARTING, ("employee1",)),
+        ("ALL_DATES", models.ALL_DATES.uncached, ()),
+        ("TASKS_WITH_DURATION", models.TASKS_WITH_DURATION, (240,)),
+        ("TASKS_LASTING", models.TASKS_LASTING, (240, 300)),
+        ("TASK_WITH_ID", models.TASK_WITH_ID, (rows // 2 or 1,)),
+        ("TASKS_WITH_NAME", models.TASKS_WITH_NAME, (NAMES[1],)),
+        ("TASKS_WITH_DATE", models.TASKS_WITH_DATE, (day(30),)),
+        ("TASKS_IN_RANGE", models.TASKS_IN_RANGE, (day(30), day(60))),
+        ("TASKS_CONTAINING", models.TASKS_CONTAINING, ("meeting review",)),
+        ("DAILY_TOTALS", models.DAILY_TOTALS, (day(30), day(60))),
+        ("WEEKLY_TOTALS", models.WEEKLY_TOTALS, (day(0), day(365))),
+        ("EMPLOYEE_TOTALS", models.EMPLOYEE_TOTALS, (day(0), day(365))),
+        ("DAYS_WITH_TASKS", models.DAYS_WITH_TASKS.uncached, (day(30), day(60))),
+        ("first_page", lambda: models.keyset_pages(models.ALL_TASKS())(), ()),
+    ]
+
+def measure(func, *args, repeat=3):
+    """returns best wall time, peak traced memory and row count of func(*args)
+
+    Timing and memory are separate runs because tracemalloc slows every
+    allocation down.
+    """
+    best = None
+    for _ in range(repeat):
+        start = default_timer()
+        count = consume(func(*args))
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    consume(func(*args))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak, "rows": count}
+
+def consume(result):
+    """iterates a helper's result the way a caller would, returning its length"""
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, str) or not hasattr(result, '__iter__'):
+        return 1
+    return sum(1 for _ in result)
+
+def throughput(func, rows):
+    start = default_timer()
+    func(rows)
+    return {"rows_per_second": len(rows) / (default_timer() - start)}
+
+def per_row(rows):
+    for row in rows:
+        models.CREATE_TASK(row)
+
+def render(rows):
+    return list_string(title="", item_template=templates['task'], list=rows)
+
+def run_size(rows, repeat):
+    results = {}
+    with synthetic_database(rows):
+        for name, func, args in helper_cases(rows):
+            results[name] = measure(func, *args, repeat=repeat)
+        sample = list(models.ALL_TASKS().limit(10000))
+        results["list_string"] = measure(render, sample, repeat=repeat)
+        new_rows = list(synthetic_tasks(1000, seed=rows + 1))
+        results["CREATE_TASK"] = throughput(per_row, new_rows)
+        results["CREATE_TASKS"] = throughput(models.CREATE_TASKS, new_rows * 10)
+    return results
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, 
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="file for the JSON results, stdout by default")
+    args = parser.parse_args(argv)
+
+    report = {"meta": metadata(), "results": {}}
+    for rows in args.rows:
+        print("benchmarking {} rows".format(rows), file=sys.stderr)
+        report["results"][str(rows)] = run_size(rows, args.repeat)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
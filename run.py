@@ -2,4 +2,4 @@
 
 import work_log
 
-work_log.run()
\ No newline at end of file
+work_log.main()
\ No newline at end of file
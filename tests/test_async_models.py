@@ -0,0 +1,115 @@
+import os
+import shutil
+import asyncio
+import tempfile
+import datetime
+import threading
+import unittest
+from unittest import mock
+
+from peewee import SqliteDatabase
+
+from work_log import async_models
+from work_log.models import initialize
+
+
+class AsyncModelsTests(unittest.TestCase):
+
+    TEST_TASKS = [
+        { "name": "nic", "notes": "incomplete notes these are", "minutes": 2 },
+        { "name": "tonia", "notes": "javascript notes", "minutes": 6 },
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = SqliteDatabase(os.path.join(self.directory, "work_log.db"))
+        initialize(self.db, profile="performance")
+        async_models.configure(max_workers=2)
+
+    def tearDown(self):
+        async_models.shutdown()
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_create_and_read(self):
+        async def session():
+            for task in self.TEST_TASKS:
+                await async_models.CREATE_TASK(task)
+            return await async_models.ALL_TASKS()
+        tasks = self.run_async(session())
+        self.assertIsInstance(tasks, list)
+        self.assertListEqual([task['name'] for task in tasks], ["nic", "tonia"])
+
+    def test_helpers_return_rows_and_scalars(self):
+        async def session():
+            await async_models.CREATE_TASKS(self.TEST_TASKS)
+            return await asyncio.gather(
+                async_models.TASKS_CONTAINING("notes"),
+                async_models.NAMES_STARTING("to"),
+                async_models.LATEST_DAY(),
+                async_models.ALL_NAMES(row_type='tuples'),
+            )
+        found, names, latest, name_rows = self.run_async(session())
+        self.assertEqual(len(found), 2)
+        self.assertListEqual(names, [{"name": "tonia"}])
+        self.assertListEqual(name_rows, [("nic",), ("tonia",)])
+        self.assertEqual(latest, datetime.date.today())
+
+    def test_slow_call_does_not_stall_others(self):
+        finished = []
+        release = threading.Event()
+        async def slow():
+            # held until fast is done, which it can't be if slow stalls it
+            await async_models.run_sync(release.wait, 5)
+            finished.append("slow")
+        async def fast():
+            await async_models.ALL_NAMES()
+            finished.append("fast")
+            release.set()
+        async def session():
+            await asyncio.gather(slow(), fast())
+        self.run_async(session())
+        self.assertListEqual(finished, ["fast", "slow"])
+
+    def test_pool_is_bounded(self):
+        async_models.configure(max_workers=1)
+        finished = []
+        started, release = threading.Event(), threading.Event()
+        def hold():
+            started.set()
+            release.wait(5)
+            finished.append("slow")
+        async def session():
+            slow = asyncio.ensure_future(async_models.run_sync(hold))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            # queued behind hold on the only worker
+            fast = asyncio.ensure_future(async_models.run_sync(finished.append, "fast"))
+            await asyncio.sleep(0)
+            release.set()
+            await asyncio.gather(slow, fast)
+        self.run_async(session())
+        self.assertListEqual(finished, ["slow", "fast"])
+
+    def test_shutdown_closes_worker_connections(self):
+        closed = []
+        close = self.db.close
+        def record_close():
+            closed.append((threading.current_thread().name, close()))
+        # both workers at once, so each opens a connection of its own
+        both = threading.Barrier(2)
+        def connect():
+            both.wait(5)
+            self.db.connect()
+        async def session():
+            await asyncio.gather(async_models.run_sync(connect), async_models.run_sync(connect))
+        self.run_async(session())
+        with mock.patch.object(self.db, 'close', side_effect=record_close):
+            async_models.shutdown()
+        self.assertEqual(len({name for name, _ in closed}), 2)
+        self.assertTrue(all(name.startswith("work_log-db") and was_open for name, was_open in closed))
+
+if __name__ == '__main__':
+    unittest.main()
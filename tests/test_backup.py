@@ -0,0 +1,153 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from io import StringIO
+from unittest import TestCase, main, mock
+
+from peewee import SqliteDatabase
+
+from work_log import cli
+from work_log.backup import backup, verify, BackupThread, ChangedSinceBackup
+from work_log.models import (initialize, archive, CREATE_TASK, CREATE_TASKS, ALL_TASKS,
+                             TASKS_IN_RANGE)
+
+
+class BackupTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = SqliteDatabase(os.path.join(self.directory, "work_log.db"))
+        initialize(self.db, profile="performance")
+        CREATE_TASKS({"name": "nic", "notes": "notes " * 50, "minutes": n} for n in range(500))
+        self.path = os.path.join(self.directory, "backup.db")
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    def test_backup_in_small_steps(self):
+        steps = []
+        result = backup(self.db, self.path, pages=4, pause=0,
+                        progress=lambda done, total: steps.append((done, total)))
+        self.assertGreater(len(steps), 2)
+        self.assertEqual(steps[-1][0], steps[-1][1])
+        self.assertEqual(result.bytes, os.path.getsize(self.path))
+        self.assertNotIn("backup.db.partial", os.listdir(self.directory))
+        self.assertListEqual(verify(self.db, self.path), [])
+
+    def test_verify_finds_later_changes(self):
+        backup(self.db, self.path)
+        CREATE_TASK({"name": "dave", "notes": "", "minutes": 5})
+        problems = verify(self.db, self.path)
+        self.assertIn("task: 501 rows, the backup has 500", problems)
+        self.assertIn("employee: 2 rows, the backup has 1", problems)
+
+    def test_verify_reports_writes_since_the_backup(self):
+        result = backup(self.db, self.path)
+        self.assertListEqual(verify(self.db, self.path, result.data_version), [])
+        thread = threading.Thread(target=lambda: CREATE_TASK({"name": "dave", "notes": "", "minutes": 5}))
+        thread.start()
+        thread.join(5)
+        with self.assertRaises(ChangedSinceBackup):
+            verify(self.db, self.path, result.data_version)
+
+    def test_interrupted_backup_leaves_no_partial_file(self):
+        def interrupt(done, total):
+            raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            backup(self.db, self.path, pages=4, pause=0, progress=interrupt)
+        self.assertFalse(any(name.startswith("backup.db") for name in os.listdir(self.directory)))
+
+    def test_writers_go_on_during_a_backup(self):
+        written = []
+        def write_once(done, total):
+            if not written:
+                # another connection, as the menu's would be
+                thread = threading.Thread(target=lambda: written.append(
+                    CREATE_TASK({"name": "dave", "notes": "", "minutes": 5})))
+                thread.start()
+                thread.join(5)
+        backup(self.db, self.path, pages=4, pause=0, progress=write_once)
+        self.assertEqual(len(written), 1)
+        # the write restarted the copy, so the backup has it
+        self.assertListEqual(verify(self.db, self.path), [])
+
+    def test_backup_refuses_its_own_file(self):
+        with self.assertRaises(ValueError):
+            backup(self.db, self.db.database)
+
+    def test_thread_backs_up_on_stop(self):
+        backups = BackupThread(self.db, self.path, interval=3600, pause=0)
+        backups.start()
+        backups.stop()
+        self.assertFalse(backups.is_alive())
+        self.assertTrue(backups.summary().startswith("backed up"))
+        self.assertEqual(len(ALL_TASKS()), 500)
+        self.assertListEqual(verify(self.db, self.path), [])
+
+    def test_thread_reports_errors(self):
+        backups = BackupThread(self.db, os.path.join(self.directory, "missing", "backup.db"), interval=3600)
+        backups.start()
+        backups.stop()
+        self.assertIn("failed", backups.summary())
+
+    def test_cli_backup_and_verify(self):
+        with mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout, \
+             mock.patch('sys.stderr', new_callable=StringIO) as mock_stderr:
+            cli.main(["--database", self.db.database, "backup", self.path, "--verify"])
+        self.assertIn("100.0% of", mock_stderr.getvalue())
+        lines = mock_stdout.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("backed up"))
+        self.assertEqual(lines[1], "verified: a restored copy matches the database")
+
+
+
+class ArchiveBackupTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = SqliteDatabase(os.path.join(self.directory, "work_log.db"))
+        initialize(self.db)
+        CREATE_TASKS([
+            {"name": "nic", "notes": "old notes", "minutes": 2, "timestamp": "2017-03-01"},
+            {"name": "dave", "notes": "current notes", "minutes": 1, "timestamp": "2019-01-04"},
+        ])
+        archive(datetime.date(2018, 1, 1))
+        os.mkdir(os.path.join(self.directory, "backups"))
+        self.path = os.path.join(self.directory, "backups", "work_log.db")
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    def test_archives_are_copied_beside_the_backup(self):
+        backup(self.db, self.path)
+        copy = os.path.join(self.directory, "backups", "work_log_2017.db")
+        self.assertListEqual(sorted(os.listdir(os.path.dirname(self.path))),
+                             ["work_log.db", "work_log_2017.db"])
+        self.assertListEqual(verify(self.db, self.path), [])
+        restored = SqliteDatabase(self.path)
+        initialize(restored)
+        try:
+            self.assertListEqual([row['notes'] for row in TASKS_IN_RANGE(datetime.date(2017, 1, 1), datetime.date(2017, 12, 31))],
+                                 ["old notes"])
+            self.assertEqual(restored.execute_sql("SELECT path FROM archive").fetchone()[0], copy)
+        finally:
+            restored.close()
+            initialize(self.db)
+
+    def test_verify_checks_archive_copies(self):
+        backup(self.db, self.path)
+        copy = sqlite3.connect(os.path.join(self.directory, "backups", "work_log_2017.db"))
+        copy.execute("DELETE FROM task")
+        copy.commit()
+        copy.close()
+        self.assertListEqual(verify(self.db, self.path),
+                             ["work_log_2017.db task: 1 rows, the backup has 0"])
+
+
+if __name__ == '__main__':
+    main()
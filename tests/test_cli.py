@@ -0,0 +1,200 @@
+import os
+import json
+import shutil
+import tempfile
+from io import StringIO
+from unittest import TestCase, main, mock
+
+from peewee import SqliteDatabase
+
+from work_log import cli, menuize
+from work_log.models import Task
+
+
+class CliTests(TestCase):
+    def setUp(self):
+        self.files = []
+        self.database = self.write_file(".db", "")
+
+    def tearDown(self):
+        for path in self.files:
+            os.remove(path)
+
+    def write_file(self, suffix, text):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, "w") as out:
+            out.write(text)
+        self.files.append(path)
+        return path
+
+    def test_read_csv(self):
+        rows = list(cli.read_csv(StringIO("name,notes,duration\nnic,stuff,2\n")))
+        self.assertListEqual(rows, [{"name": "nic", "notes": "stuff", "duration": "2"}])
+
+    def test_read_jsonl_skips_blank_lines(self):
+        rows = list(cli.read_jsonl(StringIO('{"name": "nic"}\n\n{"name": "dave"}\n')))
+        self.assertListEqual(rows, [{"name": "nic"}, {"name": "dave"}])
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_import_csv(self, mock_stdout):
+        path = self.write_file(".csv", "name,notes,duration\nnic,stuff,2\ndave,things,3\n")
+        cli.main(["--database", self.database, "import", path])
+        self.assertEqual(mock_stdout.getvalue(), "imported 2 tasks\n")
+        with SqliteDatabase(self.database).bind_ctx([Task]):
+            self.assertListEqual(
+                [task.name for task in Task.select().order_by(Task.id)], 
+                ["nic", "dave"]
+            )
+
+    def test_import_rejects_other_files(self):
+        path = self.write_file(".txt", "")
+        with self.assertRaises(SystemExit):
+            cli.main(["--database", self.database, "import", path])
+
+    def test_import_reports_bad_rows(self):
+        path = self.write_file(".jsonl", '{"name": "nic", "duration": "a"}\n')
+        with self.assertRaisesRegex(SystemExit, "row 1: duration"):
+            cli.main(["--database", self.database, "import", path])
+
+
+class StreamTests(TestCase):
+
+    def setUp(self):
+        handle, self.database = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        handle, path = tempfile.mkstemp(suffix=".jsonl")
+        with os.fdopen(handle, "w") as out:
+            out.write('{"name": "nic", "notes": "hello, world", "duration": 2, "timestamp": "2019-01-01"}\n')
+            out.write('{"name": "dave", "notes": "stuff", "duration": 3, "timestamp": "2019-02-01"}\n')
+            out.write('{"name": "nic", "notes": "more stuff", "duration": 3, "timestamp": "2019-03-01"}\n')
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            cli.main(["--database", self.database, "import", path])
+        os.remove(path)
+
+    def tearDown(self):
+        os.remove(self.database)
+
+    def run_cli(self, *args):
+        with mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            cli.main(["--database", self.database] + list(args))
+        return mock_stdout.getvalue()
+
+    def test_export_jsonl(self):
+        lines = self.run_cli("export").splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertDictEqual(json.loads(lines[0]), {
+            "id": 1, "name": "nic", "notes": "hello, world", "minutes": 120, "timestamp": "2019-01-01"
+        })
+
+    def test_export_imports_again(self):
+        paths = []
+        for fmt in ["jsonl", "csv"]:
+            handle, path = tempfile.mkstemp(suffix="." + fmt)
+            self.addCleanup(os.remove, path)
+            with os.fdopen(handle, "w") as out:
+                out.write(self.run_cli("export", "--format", fmt))
+            paths.append(path)
+        for path in paths:
+            self.assertEqual(self.run_cli("import", path), "imported 3 tasks\n")
+        self.assertEqual(len(self.run_cli("export").splitlines()), 9)
+
+    def test_search_csv(self):
+        self.assertEqual(
+            self.run_cli("search", "--format", "csv", "--date-from", "2019-01-15", "--duration", "180"),
+            "id,name,notes,minutes,timestamp\n"
+            "2,dave,stuff,180,2019-02-01\n"
+            "3,nic,more stuff,180,2019-03-01\n"
+        )
+
+    def test_search_duration_range(self):
+        lines = self.run_cli("search", "--min-duration", "150").splitlines()
+        self.assertListEqual([json.loads(line)['id'] for line in lines], [2, 3])
+        lines = self.run_cli("search", "--max-duration", "150").splitlines()
+        self.assertListEqual([json.loads(line)['id'] for line in lines], [1])
+
+    def test_search_filters_combine(self):
+        lines = self.run_cli("search", "--name", "nic", "--phrase", "stuff").splitlines()
+        self.assertListEqual([json.loads(line)['id'] for line in lines], [3])
+
+    def test_archive_then_search(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.assertEqual(self.run_cli("archive", "--before", "2019-02-01", "--directory", directory),
+                         "archived 1 tasks from 2019\n")
+        ids = lambda output: [json.loads(line)['id'] for line in output.splitlines()]
+        self.assertListEqual(ids(self.run_cli("export")), [2, 3])
+        self.assertListEqual(ids(self.run_cli("export", "--archived")), [1, 2, 3])
+        self.assertListEqual(ids(self.run_cli("search", "--date-to", "2019-01-31")), [1])
+
+    def test_export_workers_match_one_process(self):
+        for output in ["jsonl", "csv"]:
+            serial = self.run_cli("export", "--format", output)
+            for workers in ["2", "3"]:
+                self.assertEqual(self.run_cli("export", "--format", output, "--workers", workers), serial)
+
+    def test_search_workers(self):
+        self.assertEqual(self.run_cli("search", "--name", "nic", "--workers", "2"),
+                         self.run_cli("search", "--name", "nic"))
+        # ranked phrase matches stay in one process, in rank order
+        self.assertEqual(self.run_cli("search", "--phrase", "stuff", "--workers", "2"),
+                         self.run_cli("search", "--phrase", "stuff"))
+        self.assertEqual(self.run_cli("search", "--name", "nobody", "--format", "csv", "--workers", "2"),
+                         "id,name,notes,minutes,timestamp\n")
+
+    def test_archived_export_workers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.run_cli("archive", "--before", "2019-02-01", "--directory", directory)
+        self.assertEqual(self.run_cli("export", "--archived", "--workers", "2"),
+                         self.run_cli("export", "--archived"))
+
+    def test_merge(self):
+        handle, other = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.addCleanup(os.remove, other)
+        for merged in [3, 0]:
+            with mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+                cli.main(["--database", other, "merge", self.database])
+            self.assertEqual(mock_stdout.getvalue(), "merged {} tasks from {}, skipped 0 already here\n"
+                             .format(merged, self.database))
+        self.assertEqual(self.run_cli("merge", other),
+                         "merged 0 tasks from {}, skipped 3 already here\n".format(other))
+        with mock.patch('sys.stderr', new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                self.run_cli("merge", self.database)
+
+    def test_maintain(self):
+        self.assertIn("MiB", self.run_cli("maintain"))
+
+    def test_profile_prints_summary(self):
+        with mock.patch('sys.stderr', new_callable=StringIO) as mock_stderr:
+            self.run_cli("--profile", "--slow-ms", "100000", "export")
+        self.assertIn("statements", mock_stderr.getvalue())
+        self.assertIn('FROM "task"', mock_stderr.getvalue())
+
+    def test_menu_backs_up_the_given_database(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "backup.db")
+        # a fourth task and another working directory, so that neither a
+        # work_log.db there nor the project's own passes for the given file
+        with SqliteDatabase(self.database).bind_ctx([Task]):
+            Task.create(name="kim", notes="fourth", minutes=5)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory)
+        with mock.patch('sys.stdout', new_callable=StringIO), \
+             mock.patch('builtins.input', side_effect=["q"]), \
+             mock.patch('work_log.menuize.terminal', menuize.HeadlessTerminal()):
+            cli.main(["--database", self.database, "--backup-to", path])
+        self.assertListEqual(os.listdir(directory), ["backup.db"])
+        with SqliteDatabase(path).bind_ctx([Task]):
+            self.assertEqual(Task.select().count(), 4)
+
+    def test_search_rejects_bad_date(self):
+        with mock.patch('sys.stderr', new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                cli.main(["--database", self.database, "search", "--date-to", "march"])
+
+
+if __name__ == '__main__':
+    main()
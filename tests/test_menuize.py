@@ -1,7 +1,10 @@
 import sys
+import asyncio
+import datetime
 from io import StringIO
 from unittest import TestCase, main, mock
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from functools import partial
 
 from work_log import menuize
 
@@ -81,10 +84,72 @@ class MeunizeTests(TestCase):
         with self.assertRaises(SystemExit):
             self.menu.input_to_option("quit")
 
+    def test_input_to_option_queues_the_rest(self):
+        option = self.menu.input_to_option('s n "nic cage"')
+        self.assertEqual(option.__name__, "search_tasks")
+        self.assertListEqual(list(menuize.answers), ["n", "nic cage"])
+        menuize.answers.clear()
+
+    def test_ask_takes_typed_ahead_answers_first(self):
+        menuize.type_ahead("x first second")
+        with mock.patch('builtins.input', return_value="typed") as mock_input:
+            self.assertListEqual(
+                [menuize.ask(), menuize.ask(), menuize.ask()],
+                ["first", "second", "typed"]
+            )
+        mock_input.assert_called_once_with("")
+
     def test_alert_display(self):
         alert = self.menu.alert_display("BAD INPUT")
         self.assertEqual("::: BAD INPUT :::\n", alert)
 
+    def test_terminal_clear(self):
+        terminal = menuize.HeadlessTerminal()
+        terminal.clear()
+        self.assertEqual(terminal.stream.getvalue(), "\x1b[H\x1b[J")
+
+    def test_terminal_draw_whole_screen_first(self):
+        terminal = menuize.HeadlessTerminal()
+        terminal.draw("one\ntwo\n>>> ")
+        self.assertEqual(
+            terminal.stream.getvalue(),
+            "\x1b[1;1Hone\x1b[K\x1b[2;1Htwo\x1b[K\x1b[3;1H>>> \x1b[K\x1b[3;5H\x1b[J"
+        )
+
+    def test_terminal_redraws_only_changed_lines(self):
+        terminal = menuize.HeadlessTerminal()
+        terminal.draw("title\n" + "option\n" * 10 + "alert\n>>> ")
+        terminal.draw("title\n" + "option\n" * 10 + "other\n>>> ")
+        self.assertEqual(
+            terminal.stream.getvalue()[-terminal.frames[-1]:],
+            "\x1b[12;1Hother\x1b[K\x1b[13;1H>>> \x1b[K\x1b[13;5H\x1b[J"
+        )
+        self.assertLess(terminal.frames[1] * 3, terminal.frames[0])
+
+    def test_terminal_redraws_everything_after_clear(self):
+        terminal = menuize.HeadlessTerminal()
+        terminal.draw("one\n>>> ")
+        terminal.clear()
+        terminal.draw("one\n>>> ")
+        self.assertEqual(terminal.frames[0], terminal.frames[2])
+
+    def test_terminal_taller_than_screen(self):
+        terminal = menuize.HeadlessTerminal(height=3)
+        terminal.draw("1\n2\n3\n>>> ")
+        self.assertEqual(terminal.stream.getvalue(), "\x1b[H\x1b[J1\n2\n3\n>>> ")
+
+    @mock.patch('sys.stdin', StringIO("search\nquit\n"))
+    def test_loop_draws_each_screen_once(self):
+        terminal = menuize.HeadlessTerminal(height=100)
+        callback = mock.Mock()
+        with mock.patch('work_log.menuize.terminal', terminal):
+            with self.assertRaises(SystemExit):
+                self.menu.loop(callback)
+        callback.assert_called_once_with(search_tasks)
+        # a draw per screen plus the clear on exit
+        self.assertEqual(len(terminal.frames), 3)
+        self.assertIn("s) search", terminal.stream.getvalue())
+
     def test_end(self):
         with self.assertRaises(menuize.EndOption):
             menuize.end()
@@ -107,52 +172,51 @@ class MeunizeTests(TestCase):
             [add_task, search_tasks, this, "*", edit_task]
         )
 
-    def test_create_func_list_factory(self):
+    def test_compile_option_cached(self):
         def this():
             pass
         def chain_function():
             return [add_task, search_tasks, "this", "*", edit_task]
-        factory = menuize.create_func_list_factory(
-            chain_function=chain_function, 
-            this=this
-        )
-        self.assertListEqual(
-            factory(),
-            [add_task, search_tasks, this, "*", edit_task]
-        )
-        # try it again
-        self.assertListEqual(
-            factory(),
-            [add_task, search_tasks, this, "*", edit_task]
+        pipeline = menuize.compile_option(chain_function, this)
+        self.assertEqual(
+            pipeline.steps,
+            (add_task, search_tasks, this, "*", edit_task)
         )
+        # compiled once per option
+        self.assertIs(menuize.compile_option(chain_function, this), pipeline)
 
-    def test_executor_runs_second_function_first_with_arguments(self):
+    def test_pipeline_runs_keyword_steps_with_acc_result(self):
         fake_args = {"fake": "fake", "args":"args"}
         mocks = [
-            mock.Mock(side_effect=lambda **x: x), 
+            mock.Mock(side_effect=lambda **x: dict(x, acc="acc")), 
             mock.Mock(side_effect=lambda **x: x), 
         ]
-        inner = menuize.executor(**fake_args)
-        result = inner(mocks[0], mocks[1])
-        for mock_func in mocks:
-            mock_func.assert_called_once_with(**fake_args)
-        self.assertDictEqual(fake_args, result)
-
-    def test_executor_runs_second_function_with_acc_result(self):
-        fake_args = {"fake": "fake", "args":"args"}
-        fake_args_from_acc = {"fake": "fake", "args":"args", "acc":"acc"}
-        mock_func = mock.Mock(side_effect=lambda **x: x)
-        inner = menuize.executor(**fake_args)
-        result = inner(fake_args_from_acc, mock_func)
-        mock_func.assert_called_once_with(**fake_args_from_acc)
-        self.assertDictEqual(fake_args_from_acc, result)
-
-    def test_executor_ends_properly(self):
-        fake_args = {"fake": "fake", "args":"args"}
-        fake_args_from_acc = {"fake": "fake", "args":"args", "acc":"acc"}
-        inner = menuize.executor(**fake_args)
-        with self.assertRaises(menuize.EndOption):
-            result = inner(fake_args_from_acc, menuize.end)
+        result = menuize.Pipeline(mocks).run(dict(fake_args))
+        mocks[0].assert_called_once_with(**fake_args)
+        mocks[1].assert_called_once_with(acc="acc", **fake_args)
+        self.assertDictEqual(dict(fake_args, acc="acc"), result)
+
+    def test_pipeline_context_steps_share_one_dict(self):
+        @menuize.context_step
+        def mark(context):
+            context['marks'] = context.get('marks', 0) + 1
+        context = {"fake": "fake"}
+        steps = [mark, partial(mark, fake="default", other="other"), mark]
+        result = menuize.Pipeline(steps).run(context)
+        self.assertIs(result, context)
+        # partial keywords are defaults, the context wins
+        self.assertDictEqual(context, {"fake": "fake", "other": "other", "marks": 3})
+
+    def test_context_step_with_keywords(self):
+        @menuize.context_step
+        def mark(context):
+            context['mark'] = True
+        self.assertDictEqual(mark(fake="fake"), {"fake": "fake", "mark": True})
+
+    def test_pipeline_ends_properly(self):
+        with mock.patch('work_log.menuize.terminal', menuize.HeadlessTerminal()), \
+             self.assertRaises(menuize.EndOption):
+            menuize.Pipeline([menuize.clear_screen, menuize.end]).run({"fake": "fake"})
 
     def test_exec_funcs(self):
         mocks = [
@@ -166,6 +230,42 @@ class MeunizeTests(TestCase):
             mock_func.assert_called_once_with(**fake_args)
         self.assertDictEqual(result, fake_args)
 
+    def test_exec_funcs_async(self):
+        async def add_async(**kwargs):
+            await asyncio.sleep(0)
+            kwargs['async'] = True
+            return kwargs
+        def add_sync(**kwargs):
+            kwargs['sync'] = True
+            return kwargs
+        funcs = [add_sync, add_async, add_sync]
+        result = asyncio.run(menuize.exec_funcs_async(func_list=funcs))
+        self.assertDictEqual(result, {"func_list": funcs, "sync": True, "async": True})
+
+    def test_exec_funcs_async_branches(self):
+        calls = []
+        async def fetch(context):
+            await asyncio.sleep(0)
+            calls.append("fetch")
+        fetch = menuize.context_step(fetch)
+        async def last(**kwargs):
+            calls.append("last")
+            return kwargs
+        def other_branch():
+            return [lambda **kwargs: calls.append("other") or kwargs]
+        def fetch_branch():
+            return [fetch]
+        choose = partial(menuize.choice_menu, title="this title", prompt="choose", name="choice",
+                         options=[('a', other_branch), ('b', fetch_branch)])
+        menuize.answers.clear()
+        # the first word is the main menu's
+        menuize.type_ahead("x b")
+        with mock.patch('work_log.menuize.terminal', menuize.HeadlessTerminal()):
+            result = asyncio.run(menuize.exec_funcs_async(func_list=[choose, "*", last]))
+        self.assertListEqual(calls, ["fetch", "last"])
+        self.assertEqual(result['input'], {"choice": "b"})
+        self.assertNotIn('branch', result)
+
     def test_list_string_with_title(self):
         kwargs = {
             "title": "Mock title",
@@ -191,6 +291,15 @@ class MeunizeTests(TestCase):
         string = menuize.list_string(**kwargs)
         self.assertEqual(string, "\nnic\ntonia\njack\n___________________________________________________\n")
 
+    def test_list_string_with_namedtuples(self):
+        Row = namedtuple("Row", ["name"])
+        kwargs = {
+            "item_template": "{name}",
+            "list": [Row("nic"), Row("tonia")],
+        }
+        string = menuize.list_string(**kwargs)
+        self.assertEqual(string, "\nnic\ntonia\n___________________________________________________\n")
+
     @mock.patch('sys.stdout', new_callable=StringIO)
     def test_list_print(self, mock_stdout):
         kwargs = {
@@ -215,6 +324,35 @@ class MeunizeTests(TestCase):
             "Mock title\n\n\nnic\ntonia\njack\n___________________________________________________\n\n"
         )
 
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_page_print(self, mock_stdout):
+        book = [[{"name": "nic"}, {"name": "tonia"}], [{"name": "jack"}]]
+        def pages(cursor):
+            cursor = cursor or 0
+            return (
+                book[cursor],
+                cursor - 1 if cursor > 0 else None,
+                cursor + 1 if cursor + 1 < len(book) else None,
+            )
+        kwargs = {
+            "title": "Mock title",
+            "item_template": "{name}",
+            "pages": pages,
+            "other": "kept",
+        }
+        terminal = menuize.HeadlessTerminal(height=100)
+        with mock.patch('work_log.menuize.terminal', terminal):
+            with mock.patch('sys.stdin', StringIO("n\nn\np\n\n")):
+                kwargs = menuize.page_print(**kwargs)
+        self.assertDictEqual(kwargs, {"other": "kept"})
+        self.assertEqual(len(terminal.frames), 4)
+        screens = terminal.stream.getvalue()
+        # the title stays put when moving to the next page
+        second = screens[terminal.frames[0]:terminal.frames[0] + terminal.frames[1]]
+        self.assertTrue(second.startswith("\x1b[4;1Hjack\x1b[K\x1b[5;1H___"))
+        self.assertIn("p) previous ...   ", screens)
+        self.assertEqual(mock_stdout.getvalue(), "")
+
     @mock.patch('sys.stdout', new_callable=StringIO)
     def test_multiline_input(self, mock_stdout):
         kwargs = {
@@ -273,6 +411,40 @@ class MeunizeTests(TestCase):
             with self.assertRaises(ValueError):
                 kwargs = menuize.numerical_input(**kwargs)
 
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_date_input(self, mock_stdout):
+        kwargs = {
+            "name": "input_key",
+            "prompt": "gimme a date dude",
+        }
+        with mock.patch('sys.stdin', StringIO(" 2019-01-06 ")):
+            kwargs = menuize.date_input(**kwargs)
+        self.assertEqual(kwargs['input']['input_key'], datetime.date(2019, 1, 6))
+        self.assertNotIn('name', kwargs)
+        self.assertNotIn('prompt', kwargs)
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_date_input_asks_again_after_a_bad_date(self, mock_stdout):
+        kwargs = {
+            "name": "input_key",
+            "prompt": "gimme a date dude",
+        }
+        with mock.patch('sys.stdin', StringIO("2019-13-01\n2019-01-06\n")):
+            kwargs = menuize.date_input(**kwargs)
+        self.assertEqual(kwargs['input']['input_key'], datetime.date(2019, 1, 6))
+        self.assertIn("::: BAD INPUT  Please try again :::", mock_stdout.getvalue())
+        self.assertNotIn('alert', kwargs)
+
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_date_input_blank_is_none(self, mock_stdout):
+        kwargs = {
+            "name": "input_key",
+            "prompt": "gimme a date dude",
+        }
+        with mock.patch('sys.stdin', StringIO("  ")):
+            kwargs = menuize.date_input(**kwargs)
+        self.assertIsNone(kwargs['input']['input_key'])
+
     @mock.patch('sys.stdout', new_callable=StringIO)
     def test_confirmed_on_anything_but_n(self, mock_stdout):
         kwargs = {
@@ -338,28 +510,61 @@ class MeunizeTests(TestCase):
         )
         self.assertNotIn('alert', kwargs)
 
-    def test_merge_option_branch(self):
-        def this():
-            pass
-        def that():
-            pass
-        def other():
-            pass
-        def chain_function():
-            return [add_task, search_tasks, "this", "*", edit_task]
-        kwargs = {
-            'func_list_factory': menuize.create_func_list_factory(
-                    chain_function=chain_function, 
-                    this=this
-                ),
-            'func_list': [add_task, search_tasks, "this", "*", edit_task]
+    def choose(self, answers, typed_ahead=""):
+        menuize.answers.clear()
+        menuize.type_ahead(typed_ahead)
+        context = {
+            "title": "this title",
+            "prompt": "choose",
+            "name": "choice",
+            "options": [('a', add_task), ('s', search_tasks)],
         }
-        option_branch = [that, other]
-        kwargs = menuize.merge_option_branch(option_branch, kwargs)
-        self.assertListEqual(
-            kwargs['func_list'],
-            [add_task, search_tasks, this, that, other, edit_task]
+        with mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout, \
+             mock.patch('builtins.input', side_effect=answers), \
+             mock.patch('work_log.menuize.terminal', menuize.HeadlessTerminal()):
+            context = menuize.choice_menu(**context)
+        return context, mock_stdout.getvalue()
+
+    def test_choice_menu_queues_the_rest(self):
+        context, screens = self.choose(["s nic 30"])
+        self.assertIs(context['branch'], search_tasks)
+        self.assertEqual(context['input']['choice'], "s")
+        self.assertListEqual(list(menuize.answers), ["nic", "30"])
+        for key in ['title', 'prompt', 'name', 'alert']:
+            self.assertNotIn(key, context)
+        self.assertIn("s) search", screens)
+        menuize.answers.clear()
+
+    def test_choice_menu_typed_ahead_skips_the_menu(self):
+        context, screens = self.choose([], typed_ahead="x a")
+        self.assertIs(context['branch'], add_task)
+        self.assertEqual(screens, "")
+
+    def test_choice_menu_retries_without_recursing(self):
+        bad = ["x"] * (sys.getrecursionlimit() + 10)
+        context, screens = self.choose(bad + ["a"], typed_ahead="x x")
+        self.assertIs(context['branch'], add_task)
+        self.assertIn("BAD INPUT", screens)
+
+    def test_pipeline_branch(self):
+        calls = []
+        def step(name):
+            return lambda **kwargs: calls.append(name) or kwargs
+        first, that, other, last = map(step, ["first", "that", "other", "last"])
+        def branch():
+            return [that, other]
+        def choose(**kwargs):
+            return dict(kwargs, branch=branch)
+        pipeline = menuize.Pipeline([first, choose, "*", last])
+        result = pipeline.run({})
+        self.assertListEqual(calls, ["first", "that", "other", "last"])
+        self.assertNotIn('branch', result)
+        self.assertEqual(
+            pipeline.branch(branch).steps,
+            (first, choose, that, other, last)
         )
+        # each branch is compiled once
+        self.assertIs(pipeline.branch(branch), pipeline.branch(branch))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
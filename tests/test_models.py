@@ -1,9 +1,16 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
 import unittest
 import datetime
+from unittest import mock
 from functools import wraps
 
 from peewee import *
 
+from work_log import models
 from work_log.models import *
 
 class CreateTests(unittest.TestCase):
@@ -12,7 +19,7 @@ class CreateTests(unittest.TestCase):
     TEST_TASK = {
         "name": "nic", 
         "notes": "These are some notes", 
-        "duration": 6
+        "minutes": 6
     }
 
     def setUp(self):
@@ -29,21 +36,76 @@ class CreateTests(unittest.TestCase):
         self.assertEqual(task['id'], 1)
         self.assertEqual(task['name'], self.TEST_TASK['name'])
         self.assertEqual(task['notes'], self.TEST_TASK['notes'])
-        self.assertEqual(task['duration'], self.TEST_TASK['duration'])
+        self.assertEqual(task['minutes'], self.TEST_TASK['minutes'])
         self.assertEqual(task['timestamp'], datetime.date.today())
 
 
+class BulkCreateTests(unittest.TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        initialize(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def rows(self, count):
+        return ({"name": "nic", "notes": "note {}".format(n), "minutes": n % 8} 
+                for n in range(count))
+
+    def test_CREATE_TASKS(self):
+        created = CREATE_TASKS(self.rows(250), batch_size=100)
+        self.assertEqual(created, 250)
+        self.assertEqual(Task.select().count(), 250)
+        task = Task.select().where(Task.id == 250).dicts()[0]
+        self.assertEqual(task['notes'], "note 249")
+        self.assertEqual(task['minutes'], 249 % 8)
+        self.assertEqual(task['timestamp'], datetime.date.today())
+
+    def test_CREATE_TASKS_cleans_strings(self):
+        CREATE_TASKS([{"name": " NIC ", "notes": "Stuff", "minutes": "3", 
+                       "timestamp": "2018-12-01"}])
+        task = Task.select().dicts()[0]
+        self.assertEqual(task['name'], "nic")
+        self.assertEqual(task['notes'], "stuff")
+        self.assertEqual(task['minutes'], 3)
+        self.assertEqual(task['timestamp'], datetime.date(2018, 12, 1))
+
+    def test_CREATE_TASKS_rejects_whole_batch(self):
+        rows = list(self.rows(150))
+        rows[120]['minutes'] = "lots"
+        with self.assertRaisesRegex(ValueError, r"row 121: .*\(100 rows imported\)"):
+            CREATE_TASKS(rows, batch_size=100)
+        self.assertEqual(Task.select().count(), 100)
+
+    def test_durations_in_hours_become_minutes(self):
+        CREATE_TASKS([{"name": "nic", "notes": "", "duration": "2"}])
+        CREATE_TASK({"name": "nic", "notes": "", "duration": 3})
+        self.assertListEqual([task['minutes'] for task in ALL_TASKS()], [120, 180])
+
+    def test_clean_task_rejects_unknown_fields(self):
+        with self.assertRaises(ValueError):
+            clean_task({"name": "nic", "minutes": 1, "owner": 4})
+
+    def test_clean_task_drops_exported_id(self):
+        self.assertNotIn('id', clean_task({"name": "nic", "minutes": 1, "id": 4}))
+
+    def test_clean_task_requires_name(self):
+        with self.assertRaises(ValueError):
+            clean_task({"name": "  ", "minutes": 1})
+
+
 class QueryTests(unittest.TestCase):
     db = SqliteDatabase(":memory:")
     
     TEST_NAMES = ["nic", "nicolas", "tonia", "dave"]
     TEST_TASKS = [
-        { "name": "nic", "notes": "incomplete notes these are", "duration": 2 },
-        { "name": "nic", "notes": "a letter I never sent", "duration": 6 },
-        { "name": "nicolas", "notes": "bile", "duration": 1 },
-        { "name": "tonia", "notes": "these are some todo lists", "duration": 3 },
-        { "name": "tonia", "notes": "javascript notes", "duration": 6 },
-        { "name": "dave", "notes": "these are some musings", "duration": 2 },
+        { "name": "nic", "notes": "incomplete notes these are", "minutes": 2 },
+        { "name": "nic", "notes": "a letter I never sent", "minutes": 6 },
+        { "name": "nicolas", "notes": "bile", "minutes": 1 },
+        { "name": "tonia", "notes": "these are some todo lists", "minutes": 3 },
+        { "name": "tonia", "notes": "javascript notes", "minutes": 6 },
+        { "name": "dave", "notes": "these are some musings", "minutes": 2 },
     ]
     def setUp(self):
         initialize(self.db) #":memory:")
@@ -59,9 +121,25 @@ class QueryTests(unittest.TestCase):
             self.assertEqual(task['id'], idx + 1)
             self.assertEqual(task['name'], self.TEST_TASKS[idx]['name'])
             self.assertEqual(task['notes'], self.TEST_TASKS[idx]['notes'])
-            self.assertEqual(task['duration'], self.TEST_TASKS[idx]['duration'])
+            self.assertEqual(task['minutes'], self.TEST_TASKS[idx]['minutes'])
             self.assertEqual(task['timestamp'], datetime.date.today())
     
+    def test_row_types(self):
+        task = ALL_TASKS(row_type='namedtuples')[0]
+        self.assertEqual((task.id, task.name, task.minutes), (1, "nic", 2))
+        row = ALL_TASKS(row_type='tuples')[0]
+        self.assertEqual(row[:2], (1, "nic"))
+
+    def test_count_rows(self):
+        self.assertEqual(count_rows(ALL_TASKS()), 6)
+        self.assertEqual(count_rows(TASKS_WITH_NAME("tonia")), 2)
+        self.assertEqual(count_rows(ALL_TASKS(), limit=2), 2)
+        self.assertEqual(count_rows(TASKS_CONTAINING("these")), 3)
+
+    def test_bad_row_type(self):
+        with self.assertRaises(ValueError):
+            ALL_TASKS(row_type='objects')
+
     def test_ALL_NAMES(self):
         names = ALL_NAMES()
         self.assertEqual(len(names), 4)
@@ -93,6 +171,12 @@ class QueryTests(unittest.TestCase):
         for idx, task in enumerate(tasks):
             self.assertIn(task['name'], ["tonia", "nic"])
     
+    def test_TASKS_LASTING(self):
+        self.assertListEqual(sorted(task['id'] for task in TASKS_LASTING(shortest=3)), [2, 4, 5])
+        self.assertListEqual(sorted(task['id'] for task in TASKS_LASTING(2, 3)), [1, 4, 6])
+        self.assertListEqual([task['id'] for task in TASKS_MATCHING(name="nic", longest=2)], [1])
+        self.assertIn("SEARCH", " ".join(explain(TASKS_LASTING(shortest=3))))
+
     def test_TASK_WITH_ID(self):
         tasks = TASK_WITH_ID(6)
         self.assertEqual(len(tasks), 1)
@@ -113,6 +197,13 @@ class QueryTests(unittest.TestCase):
         tasks = TASKS_WITH_DATE(datetime.date.today() - datetime.timedelta(days=0))
         self.assertEqual(len(tasks), 6)
     
+    def test_TASKS_MATCHING(self):
+        tasks = TASKS_MATCHING(name="nic", phrase="notes")
+        self.assertListEqual([task['id'] for task in tasks], [1])
+        tasks = TASKS_MATCHING(duration=2, end=datetime.date.today())
+        self.assertListEqual([task['id'] for task in tasks], [1, 6])
+        self.assertEqual(len(TASKS_MATCHING()), 6)
+
     def test_TASKS_CONTAINING(self):
         tasks = TASKS_CONTAINING("these")
         self.assertEqual(len(tasks), 3)
@@ -121,5 +212,772 @@ class QueryTests(unittest.TestCase):
             { 1, 4, 6 }
         )
 
+
+class EmployeeTests(unittest.TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        initialize(self.db)
+        for name in ["nic", "nicolas hampton", "tonia", "nic"]:
+            CREATE_TASK({"name": name, "notes": "notes", "minutes": 1})
+
+    def tearDown(self):
+        self.db.close()
+
+    def names(self, rows):
+        return [row['name'] for row in rows]
+
+    def test_employees_registered_once(self):
+        self.assertListEqual(
+            [employee.name for employee in Employee.select().order_by(Employee.name)],
+            ["nic", "nicolas hampton", "tonia"]
+        )
+
+    def test_NAMES_STARTING(self):
+        self.assertListEqual(self.names(NAMES_STARTING("nic")), ["nic", "nicolas hampton"])
+        self.assertListEqual(self.names(NAMES_STARTING("ham")), ["nicolas hampton"])
+        self.assertListEqual(self.names(NAMES_STARTING("ola")), [])
+        self.assertListEqual(self.names(NAMES_STARTING("", limit=2)), ["nic", "nicolas hampton"])
+
+    def test_COUNT_NAMES_STARTING(self):
+        self.assertEqual(COUNT_NAMES_STARTING("nic"), 2)
+        self.assertEqual(COUNT_NAMES_STARTING("nic", limit=1), 1)
+        self.assertEqual(COUNT_NAMES_STARTING("ham", limit=2), 1)
+        self.assertEqual(COUNT_NAMES_STARTING("ola", limit=2), 0)
+        self.assertEqual(COUNT_NAMES_STARTING("", limit=2), 2)
+
+    def test_NAME_EXISTS(self):
+        self.assertTrue(NAME_EXISTS("nic"))
+        self.assertFalse(NAME_EXISTS("ni"))
+
+    def test_COUNT_NAMES_MATCHING(self):
+        self.assertEqual(COUNT_NAMES_MATCHING("ni"), 3)
+        self.assertEqual(COUNT_NAMES_MATCHING("ni", limit=2), 2)
+
+    def test_new_names_added_to_loaded_index(self):
+        NAMES_STARTING("")
+        CREATE_TASK({"name": "dave", "notes": "notes", "minutes": 1})
+        CREATE_TASKS([{"name": "david", "notes": "notes", "minutes": 1}])
+        self.assertListEqual(self.names(NAMES_STARTING("dav")), ["dave", "david"])
+
+    def test_existing_names_registered_on_initialize(self):
+        self.db.execute_sql('DROP TABLE employee')
+        # an older schema, from before this table or index existed
+        self.db.pragma('user_version', 0)
+        initialize(self.db)
+        self.assertListEqual(self.names(NAMES_STARTING("t")), ["tonia"])
+
+    def test_index_add_is_idempotent(self):
+        index = EmployeeIndex()
+        index.load(["b", "a"])
+        index.add("a")
+        index.add("c d")
+        self.assertListEqual(index.names, ["a", "b", "c d"])
+        self.assertListEqual(index.starting("d"), ["c d"])
+
+    def test_index_not_loaded_ignores_add(self):
+        index = EmployeeIndex()
+        index.add("a")
+        self.assertIsNone(index.names)
+
+
+class CacheTests(unittest.TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        initialize(self.db)
+        CREATE_TASK({"name": "nic", "notes": "notes", "minutes": 1})
+        self.start = query_cache.stats()
+
+    def tearDown(self):
+        self.db.close()
+
+    def counts(self):
+        stats = query_cache.stats()
+        return stats['hits'] - self.start['hits'], stats['misses'] - self.start['misses']
+
+    def test_repeat_calls_hit(self):
+        first = NAMES_MATCHING("ni")
+        second = NAMES_MATCHING("ni")
+        self.assertListEqual(first, second)
+        self.assertIsNot(first, second)
+        NAMES_MATCHING("n")
+        self.assertEqual(self.counts(), (1, 2))
+
+    def test_row_types_cached_apart(self):
+        self.assertListEqual(ALL_NAMES(row_type='tuples'), [("nic",)])
+        self.assertListEqual(ALL_NAMES(), [{"name": "nic"}])
+        self.assertEqual(DAYS_WITH_TASKS(None, None, row_type='namedtuples')[0].day, datetime.date.today())
+        self.assertEqual(self.counts(), (0, 3))
+        with self.assertRaises(ValueError):
+            NAMES_MATCHING("n", row_type='objects')
+
+    def test_create_invalidates(self):
+        self.assertEqual(len(ALL_NAMES()), 1)
+        CREATE_TASK({"name": "dave", "notes": "notes", "minutes": 1})
+        self.assertEqual(len(ALL_NAMES()), 2)
+        CREATE_TASKS([{"name": "tonia", "notes": "notes", "minutes": 1}])
+        self.assertEqual(len(ALL_NAMES()), 3)
+        self.assertEqual(self.counts(), (0, 3))
+
+    def test_lru_eviction(self):
+        cache = QueryCache(maxsize=2)
+        cache.get("a", lambda: 1)
+        cache.get("b", lambda: 2)
+        cache.get("a", lambda: 1)
+        cache.get("c", lambda: 3)
+        self.assertListEqual(list(cache.entries), ["a", "c"])
+        self.assertEqual(cache.get("b", lambda: "reloaded"), "reloaded")
+        self.assertDictEqual(cache.stats(), {
+            "hits": 1, "misses": 4, "size": 2, "maxsize": 2, "generation": 0
+        })
+
+    def test_write_during_load_is_not_cached(self):
+        cache = QueryCache()
+        cache.get("a", cache.bump)
+        self.assertNotIn("a", cache.entries)
+
+
+class OtherWriterTests(unittest.TestCase):
+    """another process writing the same file, as a second operator's would"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = SqliteDatabase(os.path.join(self.directory, "work_log.db"))
+        initialize(self.db, profile="performance")
+        CREATE_TASK({"name": "nic", "notes": "notes", "minutes": 1, "timestamp": "2019-01-02"})
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    def write_elsewhere(self, name, day):
+        other = sqlite3.connect(self.db.database)
+        with other:
+            other.execute("INSERT INTO task (name, notes, minutes, timestamp) VALUES (?, '', 5, ?)",
+                          (name, day))
+        other.close()
+
+    def test_cached_results_follow_other_writers(self):
+        self.assertListEqual(ALL_NAMES(), [{"name": "nic"}])
+        days = lambda: [row['day'] for row in DAYS_WITH_TASKS(datetime.date(2019, 1, 1),
+                                                              datetime.date(2019, 1, 31))]
+        self.assertListEqual(days(), [datetime.date(2019, 1, 2)])
+        self.write_elsewhere("kim", "2019-01-09")
+        self.assertListEqual(ALL_NAMES(), [{"name": "kim"}, {"name": "nic"}])
+        self.assertListEqual(days(), [datetime.date(2019, 1, 2), datetime.date(2019, 1, 9)])
+
+    def test_name_index_follows_other_writers(self):
+        self.assertListEqual(NAMES_STARTING("ki"), [])
+        self.write_elsewhere("kimberly", "2019-01-09")
+        self.assertListEqual(NAMES_STARTING("ki"), [{"name": "kimberly"}])
+        self.assertEqual(COUNT_NAMES_STARTING("ki"), 1)
+
+
+class PageTests(unittest.TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        initialize(self.db)
+        CREATE_TASKS({"name": "nic", "notes": "note", "minutes": n % 3} for n in range(7))
+
+    def tearDown(self):
+        self.db.close()
+
+    def ids(self, rows):
+        return [row['id'] for row in rows]
+
+    def test_keyset_pages_forward_and_back(self):
+        pages = keyset_pages(ALL_TASKS(), size=3)
+        rows, previous, following = pages()
+        self.assertListEqual(self.ids(rows), [1, 2, 3])
+        self.assertIsNone(previous)
+        rows, previous, following = pages(following)
+        self.assertListEqual(self.ids(rows), [4, 5, 6])
+        rows, previous, following = pages(following)
+        self.assertListEqual(self.ids(rows), [7])
+        self.assertIsNone(following)
+        rows, previous, following = pages(previous)
+        self.assertListEqual(self.ids(rows), [4, 5, 6])
+        rows, previous, following = pages(previous)
+        self.assertListEqual(self.ids(rows), [1, 2, 3])
+        self.assertIsNone(previous)
+        self.assertIsNotNone(following)
+
+    def test_keyset_pages_namedtuples(self):
+        pages = keyset_pages(ALL_TASKS(row_type='namedtuples'), size=3)
+        rows, previous, following = pages(pages()[2])
+        self.assertListEqual([row.id for row in rows], [4, 5, 6])
+        rows, previous, following = pages(previous)
+        self.assertListEqual([row.id for row in rows], [1, 2, 3])
+
+    def test_keyset_pages_keeps_filter(self):
+        rows, previous, following = keyset_pages(TASKS_WITH_DURATION(0), size=2)()
+        self.assertListEqual(self.ids(rows), [1, 4])
+        rows, _, following = keyset_pages(TASKS_WITH_DURATION(0), size=2)(following)
+        self.assertListEqual(self.ids(rows), [7])
+        self.assertIsNone(following)
+
+    def test_keyset_pages_uses_primary_key(self):
+        query = ALL_TASKS().where(Task.id > 3).order_by(Task.id).limit(4)
+        self.assertIn("PRIMARY KEY", " ".join(explain(query)))
+
+    def test_keyset_pages_empty(self):
+        self.assertEqual(keyset_pages(TASKS_WITH_NAME("nobody"))(), ([], None, None))
+
+    def test_offset_pages(self):
+        pages = offset_pages(ALL_TASKS().order_by(Task.id.desc()), size=4)
+        rows, previous, following = pages()
+        self.assertListEqual(self.ids(rows), [7, 6, 5, 4])
+        self.assertIsNone(previous)
+        rows, previous, following = pages(following)
+        self.assertListEqual(self.ids(rows), [3, 2, 1])
+        self.assertEqual(previous, 0)
+        self.assertIsNone(following)
+
+
+class ProfileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "work_log.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self, profile, **pragmas):
+        # timeout=0 makes a blocked reader fail at once instead of waiting
+        database = SqliteDatabase(self.path, timeout=0)
+        initialize(database, profile=profile, **pragmas)
+        CREATE_TASK({"name": "nic", "notes": "first", "minutes": 1})
+        return database
+
+    def search_during_write(self, database):
+        """runs a search while another thread holds a write transaction"""
+        writing, done = threading.Event(), threading.Event()
+        def writer():
+            with database.atomic('EXCLUSIVE'):
+                CREATE_TASK({"name": "nic", "notes": "second", "minutes": 2})
+                writing.set()
+                done.wait(5)
+            database.close()
+        thread = threading.Thread(target=writer)
+        thread.start()
+        writing.wait(5)
+        try:
+            return [task['notes'] for task in TASKS_WITH_NAME("nic")]
+        finally:
+            done.set()
+            thread.join()
+            database.close()
+
+    def test_performance_profile_pragmas(self):
+        database = self.open("performance", cache_size=-1024)
+        self.assertEqual(database.journal_mode, "wal")
+        self.assertEqual(database.synchronous, 1)
+        self.assertEqual(database.cache_size, -1024)
+        self.assertEqual(database.mmap_size, 256 * 1024 * 1024)
+        self.assertEqual(database.pragma("temp_store"), 2)
+        database.close()
+
+    def test_pragmas_apply_to_new_connections(self):
+        database = self.open("performance", mmap_size=0)
+        database.close()
+        database.connect()
+        self.assertEqual(database.mmap_size, 0)
+        self.assertEqual(database.synchronous, 1)
+        database.close()
+
+    def test_search_does_not_wait_for_writer_with_wal(self):
+        database = self.open("performance")
+        self.assertListEqual(self.search_during_write(database), ["first"])
+
+    def test_search_blocked_by_writer_without_wal(self):
+        database = self.open("default")
+        with self.assertRaises(OperationalError):
+            self.search_during_write(database)
+
+
+class SearchTests(unittest.TestCase):
+    db = SqliteDatabase(":memory:")
+
+    TEST_TASKS = [
+        { "name": "nic", "notes": "incomplete notes these are", "minutes": 2 },
+        { "name": "tonia", "notes": "these notes, these todos, these lists", "minutes": 3 },
+        { "name": "dave", "notes": "musings on javascript", "minutes": 2 },
+    ]
+
+    def setUp(self):
+        initialize(self.db)
+        for task in self.TEST_TASKS:
+            CREATE_TASK(task)
+
+    def tearDown(self):
+        self.db.close()
+
+    def ids(self, tasks):
+        return [task['id'] for task in tasks]
+
+    def test_search_terms(self):
+        self.assertEqual(search_terms(" java   no!"), '"java"* "no"*')
+
+    def test_ranked_by_relevance(self):
+        self.assertListEqual(self.ids(TASKS_CONTAINING("these")), [2, 1])
+
+    def test_prefix_match(self):
+        self.assertListEqual(self.ids(TASKS_CONTAINING("java")), [3])
+
+    def test_all_terms_must_match(self):
+        self.assertListEqual(self.ids(TASKS_CONTAINING("notes incomplete")), [1])
+
+    def test_matches_name(self):
+        self.assertListEqual(self.ids(TASKS_CONTAINING("toni")), [2])
+
+    def test_does_not_scan_task_table(self):
+        plan = " ".join(explain(TASKS_CONTAINING("these")))
+        self.assertIn("VIRTUAL TABLE", plan)
+        self.assertNotIn("SCAN t1", plan)
+
+    def test_index_follows_updates_and_deletes(self):
+        Task.update(notes="rewritten").where(Task.id == 2).execute()
+        Task.delete().where(Task.id == 1).execute()
+        self.assertListEqual(self.ids(TASKS_CONTAINING("these")), [])
+        self.assertListEqual(self.ids(TASKS_CONTAINING("rewrit")), [2])
+
+    def test_existing_tasks_indexed_on_initialize(self):
+        self.db.execute_sql('DROP TABLE task_fts')
+        # an older schema, from before this table or index existed
+        self.db.pragma('user_version', 0)
+        initialize(self.db)
+        self.assertListEqual(self.ids(TASKS_CONTAINING("these")), [2, 1])
+
+    @mock.patch('work_log.models.FTS_ENABLED', False)
+    def test_falls_back_to_like(self):
+        self.assertSetEqual(set(self.ids(TASKS_CONTAINING("ese"))), {1, 2})
+
+
+class TotalsTests(unittest.TestCase):
+    db = SqliteDatabase(":memory:")
+
+    TEST_TASKS = [
+        { "name": "nic", "notes": "a", "minutes": 2, "timestamp": "2019-01-07" },
+        { "name": "nic", "notes": "b", "minutes": 3, "timestamp": "2019-01-07" },
+        { "name": "tonia", "notes": "c", "minutes": 4, "timestamp": "2019-01-08" },
+        { "name": "nic", "notes": "d", "minutes": 1, "timestamp": "2019-01-14" },
+    ]
+
+    def setUp(self):
+        initialize(self.db)
+        CREATE_TASKS(self.TEST_TASKS)
+
+    def tearDown(self):
+        self.db.close()
+
+    def totals(self, rows, *keys):
+        return [tuple(row[key] for key in keys) for row in rows]
+
+    def test_DAILY_TOTALS(self):
+        self.assertListEqual(
+            self.totals(DAILY_TOTALS(), 'day', 'name', 'minutes', 'tasks'),
+            [(datetime.date(2019, 1, 7), "nic", 5, 2),
+             (datetime.date(2019, 1, 8), "tonia", 4, 1),
+             (datetime.date(2019, 1, 14), "nic", 1, 1)]
+        )
+
+    def test_DAILY_TOTALS_in_range(self):
+        self.assertListEqual(
+            self.totals(DAILY_TOTALS(datetime.date(2019, 1, 8), datetime.date(2019, 1, 14)), 'name'),
+            [("tonia",), ("nic",)]
+        )
+
+    def test_WEEKLY_TOTALS(self):
+        self.assertListEqual(
+            self.totals(WEEKLY_TOTALS(), 'week', 'name', 'minutes', 'tasks'),
+            [("2019-01", "nic", 5, 2), ("2019-01", "tonia", 4, 1), ("2019-02", "nic", 1, 1)]
+        )
+
+    def test_EMPLOYEE_TOTALS(self):
+        self.assertListEqual(
+            self.totals(EMPLOYEE_TOTALS(end=datetime.date(2019, 1, 13)), 'name', 'minutes', 'tasks'),
+            [("nic", 5, 2), ("tonia", 4, 1)]
+        )
+
+    def test_totals_follow_updates_and_deletes(self):
+        Task.delete().where(Task.id == 4).execute()
+        Task.update(name="tonia", timestamp=datetime.date(2019, 1, 8)).where(Task.id == 1).execute()
+        self.assertListEqual(
+            self.totals(DAILY_TOTALS(), 'name', 'minutes', 'tasks'),
+            [("nic", 3, 1), ("tonia", 6, 2)]
+        )
+
+    def test_existing_tasks_totalled_on_initialize(self):
+        self.db.execute_sql('DROP TABLE daily_total')
+        # an older schema, from before this table or index existed
+        self.db.pragma('user_version', 0)
+        initialize(self.db)
+        self.assertListEqual(
+            self.totals(EMPLOYEE_TOTALS(), 'name', 'minutes', 'tasks'),
+            [("nic", 6, 3), ("tonia", 4, 1)]
+        )
+
+    def test_hours_and_average_in_sql(self):
+        CREATE_TASK({"name": "tonia", "notes": "e", "minutes": 90, "timestamp": "2019-01-08"})
+        self.assertListEqual(
+            self.totals(EMPLOYEE_TOTALS(), 'name', 'minutes', 'hours', 'tasks', 'average'),
+            [("nic", 6, 0.1, 3, 2.0), ("tonia", 94, 1.57, 2, 47.0)]
+        )
+
+    def test_range_served_by_index(self):
+        plan = " ".join(explain(DAILY_TOTALS(datetime.date(2019, 1, 8))))
+        self.assertIn("SEARCH", plan)
+
+    def test_DAYS_WITH_TASKS(self):
+        days = DAYS_WITH_TASKS(datetime.date(2019, 1, 1), datetime.date(2019, 1, 8))
+        self.assertListEqual(
+            [row['day'] for row in days], 
+            [datetime.date(2019, 1, 7), datetime.date(2019, 1, 8)]
+        )
+
+    def test_LATEST_DAY(self):
+        self.assertEqual(LATEST_DAY(), datetime.date(2019, 1, 14))
+        Task.delete().execute()
+        self.assertIsNone(LATEST_DAY())
+
+    def test_TASKS_IN_RANGE(self):
+        tasks = TASKS_IN_RANGE(datetime.date(2019, 1, 8), datetime.date(2019, 1, 14))
+        self.assertListEqual([task['notes'] for task in tasks], ["c", "d"])
+        self.assertIn("SEARCH", " ".join(explain(tasks)))
+
+
+class IndexTests(unittest.TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        initialize(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_indexes_created(self):
+        indexes = {tuple(index.columns) for index in self.db.get_indexes('task')}
+        self.assertSetEqual(
+            indexes,
+            {('name', 'timestamp'), ('timestamp',), ("minutes",)}
+        )
+
+    def test_initialize_adds_indexes_to_existing_table(self):
+        self.db.execute_sql('DROP INDEX "task_name_timestamp"')
+        # an older schema, from before this table or index existed
+        self.db.pragma('user_version', 0)
+        initialize(self.db)
+        self.assertIn(
+            'task_name_timestamp', 
+            [index.name for index in self.db.get_indexes('task')]
+        )
+
+    def test_initialize_skips_schema_when_current(self):
+        self.assertEqual(self.db.pragma('user_version'), SCHEMA_VERSION)
+        self.db.execute_sql('DROP INDEX "task_name_timestamp"')
+        initialize(self.db)
+        self.assertNotIn(
+            'task_name_timestamp', 
+            [index.name for index in self.db.get_indexes('task')]
+        )
+
+    def test_lookups_search_indexes(self):
+        for helper, arg in [(TASKS_WITH_NAME, "nic"),
+                            (TASKS_WITH_DATE, datetime.date.today()),
+                            (TASKS_WITH_DURATION, 2)]:
+            plan = " ".join(explain(helper(arg)))
+            self.assertIn("SEARCH", plan)
+            self.assertIn("USING INDEX", plan)
+
+    def test_group_bys_use_covering_indexes(self):
+        for helper in [ALL_NAMES, ALL_DATES]:
+            plan = " ".join(explain(helper.uncached()))
+            self.assertIn("COVERING INDEX", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+class ArchiveTests(unittest.TestCase):
+
+    TEST_TASKS = [
+        { "name": "nic", "notes": "old notes", "minutes": 2, "timestamp": "2017-03-01" },
+        { "name": "tonia", "notes": "older notes", "minutes": 3, "timestamp": "2016-05-02" },
+        { "name": "nic", "notes": "last year", "minutes": 4, "timestamp": "2018-07-03" },
+        { "name": "dave", "notes": "current notes", "minutes": 1, "timestamp": "2019-01-04" },
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = SqliteDatabase(os.path.join(self.directory, "work_log.db"))
+        initialize(self.db)
+        CREATE_TASKS(self.TEST_TASKS)
+        self.moved = archive(datetime.date(2018, 1, 1))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    def ids(self, rows):
+        return [row['id'] for row in rows]
+
+    def test_archive_moves_years_to_files(self):
+        self.assertDictEqual(self.moved, {2016: 1, 2017: 1})
+        self.assertListEqual(sorted(os.listdir(self.directory)),
+                             ["work_log.db", "work_log_2016.db", "work_log_2017.db"])
+        self.assertListEqual(self.ids(ALL_TASKS()), [3, 4])
+
+    def test_range_reads_overlapping_years(self):
+        self.assertListEqual(
+            sorted(self.ids(TASKS_IN_RANGE(datetime.date(2017, 1, 1), datetime.date(2018, 12, 31)))), [1, 3])
+        self.assertListEqual(self.ids(TASKS_WITH_DATE(datetime.date(2016, 5, 2))), [2])
+        plan = " ".join(explain(TASKS_IN_RANGE(datetime.date(2017, 1, 1), datetime.date(2017, 2, 1))))
+        self.assertIn("archive_2017", plan)
+        self.assertNotIn("archive_2016", plan)
+
+    def test_range_from_another_connection(self):
+        read = lambda: sorted(self.ids(TASKS_MATCHING(start=datetime.date(2017, 1, 1))))
+        self.assertListEqual(read(), [1, 3, 4])
+        results = []
+        thread = threading.Thread(target=lambda: results.append(read()))
+        thread.start()
+        thread.join()
+        self.assertListEqual(results, [[1, 3, 4]])
+        self.db.close()
+        self.db.connect()
+        self.assertListEqual(read(), [1, 3, 4])
+
+    def test_TASKS_MATCHING_archived(self):
+        self.assertListEqual(self.ids(TASKS_MATCHING()), [3, 4])
+        self.assertListEqual(self.ids(TASKS_MATCHING(archived=True)), [1, 2, 3, 4])
+        self.assertListEqual(self.ids(TASKS_MATCHING(phrase="old", end=datetime.date(2017, 12, 31))), [1, 2])
+
+    def test_keyset_pages_across_partitions(self):
+        pages = keyset_pages(TASKS_MATCHING(archived=True), size=3)
+        rows, previous, following = pages()
+        self.assertListEqual(self.ids(rows), [1, 2, 3])
+        self.assertListEqual(self.ids(pages(following)[0]), [4])
+
+    def test_totals_kept(self):
+        self.assertEqual(len(DAILY_TOTALS()), 4)
+
+    def test_newest_task_stays_live(self):
+        archive(datetime.date(2020, 1, 1))
+        self.assertListEqual(self.ids(ALL_TASKS()), [4])
+        CREATE_TASK({"name": "nic", "notes": "new", "minutes": 1})
+        self.assertListEqual(self.ids(TASKS_MATCHING(archived=True)), [1, 2, 3, 4, 5])
+
+    def test_archives_found_after_reopening(self):
+        self.db.close()
+        initialize(self.db)
+        self.assertListEqual(self.ids(TASKS_IN_RANGE(datetime.date(2016, 1, 1), datetime.date(2016, 12, 31))), [2])
+
+    def test_maintain(self):
+        CREATE_TASKS({"name": "nic", "notes": "x" * 1000, "minutes": 1} for _ in range(200))
+        Task.delete().where(Task.notes.startswith("x")).execute()
+        before, after = maintain()
+        self.assertLess(after, before)
+        self.assertTrue(self.db.table_exists('sqlite_stat1'))
+
+    def test_in_memory_needs_directory(self):
+        with self.assertRaises(ValueError):
+            archive_path(SqliteDatabase(":memory:"), 2017)
+
+class ManyYearsTests(unittest.TestCase):
+    """more archived years than sqlite attaches to one connection"""
+
+    YEARS = range(2005, 2020)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = SqliteDatabase(os.path.join(self.directory, "work_log.db"))
+        initialize(self.db)
+        CREATE_TASKS({"name": "nic", "notes": "year {}".format(year), "minutes": 1,
+                      "timestamp": "{}-06-01".format(year)} for year in self.YEARS)
+        CREATE_TASK({"name": "nic", "notes": "live", "minutes": 1, "timestamp": "2020-01-02"})
+        self.moved = archive(datetime.date(2020, 1, 1))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    def notes(self, rows):
+        return [row['notes'] for row in rows]
+
+    def test_archive_every_year(self):
+        self.assertDictEqual(self.moved, {year: 1 for year in self.YEARS})
+        self.assertListEqual(self.notes(ALL_TASKS()), ["live"])
+
+    def test_read_every_year(self):
+        expected = ["year {}".format(year) for year in self.YEARS] + ["live"]
+        self.assertListEqual(self.notes(TASKS_MATCHING(archived=True)), expected)
+        self.assertListEqual(
+            self.notes(TASKS_IN_RANGE(datetime.date(2006, 1, 1), datetime.date(2008, 12, 31))),
+            ["year 2006", "year 2007", "year 2008"])
+        # the copy stays current when an archived year gains tasks
+        CREATE_TASK({"name": "dave", "notes": "late entry", "minutes": 1, "timestamp": "2007-02-02"})
+        CREATE_TASK({"name": "nic", "notes": "newest", "minutes": 1})
+        archive(datetime.date(2020, 1, 1))
+        self.assertIn("late entry", self.notes(TASKS_MATCHING(archived=True)))
+        self.assertEqual(len(TASKS_MATCHING(archived=True)), len(expected) + 2)
+
+    def test_merge_hashes_every_year(self):
+        path = os.path.join(self.directory, "other.db")
+        other = SqliteDatabase(path)
+        initialize(other)
+        CREATE_TASKS([{"name": "nic", "notes": "year 2005", "minutes": 1, "timestamp": "2005-06-01"},
+                      {"name": "kim", "notes": "new", "minutes": 1, "timestamp": "2005-06-01"}])
+        other.close()
+        initialize(self.db)
+        self.assertListEqual(list(merge([path]).values()), [(1, 1)])
+
+
+class MinutesMigrationTests(unittest.TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        # the schema of version 2, with durations in whole hours
+        self.db.connect()
+        self.db.execute_sql('CREATE TABLE "task" ("id" INTEGER NOT NULL PRIMARY KEY, '
+                            '"name" VARCHAR(255) NOT NULL, "notes" TEXT NOT NULL, '
+                            '"duration" TIME NOT NULL, "timestamp" DATE NOT NULL)')
+        self.db.execute_sql('CREATE INDEX "task_duration" ON "task" ("duration")')
+        self.db.execute_sql('CREATE TABLE "daily_total" ("id" INTEGER NOT NULL PRIMARY KEY, '
+                            '"name" VARCHAR(255) NOT NULL, "day" DATE NOT NULL, '
+                            '"hours" INTEGER NOT NULL, "tasks" INTEGER NOT NULL)')
+        self.db.execute_sql('CREATE UNIQUE INDEX "daily_total_name_day" ON "daily_total" ("name", "day")')
+        self.db.execute_sql("INSERT INTO task VALUES (1, 'nic', 'notes', 2, '2019-01-07'), "
+                            "(2, 'nic', 'more notes', 3, '2019-01-07')")
+        self.db.execute_sql("INSERT INTO daily_total VALUES (1, 'nic', '2019-01-07', 5, 2)")
+        self.db.pragma('user_version', 2)
+        initialize(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_durations_become_minutes(self):
+        self.assertListEqual([task['minutes'] for task in ALL_TASKS()], [120, 180])
+        self.assertIn(('minutes',), {tuple(index.columns) for index in self.db.get_indexes('task')})
+        self.assertEqual(self.db.pragma('user_version'), SCHEMA_VERSION)
+
+    def test_totals_become_minutes_and_stay_current(self):
+        CREATE_TASK({"name": "nic", "notes": "x", "minutes": 30, "timestamp": "2019-01-07"})
+        self.assertListEqual(
+            [(row['minutes'], row['tasks']) for row in DAILY_TOTALS()], [(330, 3)])
+
+    def test_search_still_indexed(self):
+        self.assertListEqual([task['id'] for task in TASKS_CONTAINING("more")], [2])
+
+
+class MergeTests(unittest.TestCase):
+
+    SITES = {
+        "north.db": [
+            { "name": "nic", "notes": "shared", "minutes": 30, "timestamp": "2019-01-02" },
+            { "name": "nic", "notes": "north", "minutes": 45, "timestamp": "2019-01-03" },
+            { "name": "nic", "notes": "north", "minutes": 45, "timestamp": "2019-01-03" },
+        ],
+        "south.db": [
+            { "name": "dave", "notes": "south", "minutes": 60, "timestamp": "2019-01-02" },
+            { "name": "nic", "notes": "shared", "minutes": 30, "timestamp": "2019-01-02" },
+            { "name": "tonia", "notes": "south", "minutes": 15, "timestamp": "2019-01-04" },
+        ],
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sources = []
+        for name, tasks in self.SITES.items():
+            self.sources.append(os.path.join(self.directory, name))
+            source = SqliteDatabase(self.sources[-1])
+            initialize(source)
+            CREATE_TASKS(tasks)
+            source.close()
+        self.db = SqliteDatabase(os.path.join(self.directory, "work_log.db"))
+        initialize(self.db)
+        CREATE_TASK({ "name": "dave", "notes": "south", "minutes": 60, "timestamp": "2019-01-02" })
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    def contents(self):
+        return [(task['id'], task['name'], task['notes']) for task in ALL_TASKS()]
+
+    def test_merge_skips_duplicates_and_renumbers(self):
+        results = merge(self.sources)
+        self.assertListEqual(list(results.values()), [(2, 1), (1, 2)])
+        self.assertListEqual(self.contents(), [
+            (1, "dave", "south"), (2, "nic", "shared"), (3, "nic", "north"), (4, "tonia", "south")
+        ])
+        self.assertListEqual([(row['name'], row['tasks']) for row in DAILY_TOTALS()],
+                             [("dave", 1), ("nic", 1), ("nic", 1), ("tonia", 1)])
+        self.assertEqual(TaskDigest.select().count(), 4)
+
+    def test_merge_again_reads_only_new_tasks(self):
+        merge(self.sources)
+        self.assertListEqual(list(merge(self.sources).values()), [(0, 0), (0, 0)])
+        self.assertEqual(len(self.contents()), 4)
+
+    def test_merge_resumes_after_interruption(self):
+        calls = []
+        insert_many = TaskDigest.insert_many
+        def fail_second_batch(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 3:
+                raise OperationalError("disk I/O error")
+            return insert_many(*args, **kwargs)
+        # batches of one: the digest catch-up, then one insert per new task
+        with mock.patch.object(TaskDigest, 'insert_many', side_effect=fail_second_batch):
+            with self.assertRaises(OperationalError):
+                merge(self.sources, batch_size=1)
+        self.assertEqual(len(self.contents()), 2)
+        self.assertEqual(MergeProgress.get(source=os.path.abspath(self.sources[0])).last_id, 1)
+        merge(self.sources, batch_size=1)
+        self.assertEqual(len(self.contents()), 4)
+
+    def test_batches_hold_the_write_lock_from_their_first_read(self):
+        locked = []
+        known_digests = models.known_digests
+        def try_writing(digests):
+            other = sqlite3.connect(self.db.database, timeout=0)
+            try:
+                other.execute("BEGIN IMMEDIATE")
+                other.rollback()
+                locked.append(False)
+            except sqlite3.OperationalError:
+                locked.append(True)
+            finally:
+                other.close()
+            return known_digests(digests)
+        with mock.patch('work_log.models.known_digests', side_effect=try_writing):
+            merge(self.sources)
+        self.assertTrue(locked)
+        self.assertTrue(all(locked))
+
+    def test_archived_tasks_count_as_known(self):
+        # the newest task stays live, so dave's is the one archived
+        CREATE_TASK({ "name": "kim", "notes": "later", "minutes": 5, "timestamp": "2019-03-01" })
+        self.assertDictEqual(archive(datetime.date(2019, 2, 1), directory=self.directory), {2019: 1})
+        self.assertListEqual(list(merge(self.sources[1:]).values()), [(2, 1)])
+
+    def test_merge_source_in_hours(self):
+        path = os.path.join(self.directory, "old.db")
+        old = SqliteDatabase(path)
+        old.execute_sql('CREATE TABLE "task" ("id" INTEGER NOT NULL PRIMARY KEY, '
+                        '"name" VARCHAR(255) NOT NULL, "notes" TEXT NOT NULL, '
+                        '"duration" TIME NOT NULL, "timestamp" DATE NOT NULL)')
+        old.execute_sql("INSERT INTO task VALUES (1, 'dave', 'south', 1, '2019-01-02'), "
+                        "(2, 'kim', 'old', 2, '2019-01-05')")
+        old.close()
+        self.assertListEqual(list(merge([path]).values()), [(1, 1)])
+        self.assertEqual(TASKS_WITH_NAME("kim")[0]['minutes'], 120)
+
+    def test_merge_rejects_itself_and_missing_files(self):
+        for path in [self.db.database, os.path.join(self.directory, "missing.db")]:
+            with self.assertRaises(ValueError):
+                merge([path])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,32 @@
+from unittest import TestCase, main
+
+from peewee import SqliteDatabase
+
+from work_log.models import initialize, CREATE_TASKS, TASKS_MATCHING
+from work_log.parallel import id_shards
+
+
+class IdShardTests(TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        initialize(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_shards_cover_every_id_once(self):
+        CREATE_TASKS({"name": "nic", "notes": "", "minutes": 30} for _ in range(10))
+        shards = id_shards(TASKS_MATCHING(), 3)
+        self.assertListEqual(shards, [(1, 4), (5, 8), (9, 10)])
+
+    def test_shards_follow_filters(self):
+        CREATE_TASKS({"name": name, "notes": "", "minutes": 30} for name in ["nic", "dave", "nic", "dave"])
+        self.assertListEqual(id_shards(TASKS_MATCHING(name="dave"), 8), [(2, 2), (3, 3), (4, 4)])
+
+    def test_no_shards_without_rows(self):
+        self.assertListEqual(id_shards(TASKS_MATCHING(), 4), [])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import gc
+import os
+import shutil
+import logging
+import tempfile
+from io import StringIO
+from unittest import TestCase, main, mock
+
+from peewee import SqliteDatabase
+
+from work_log import menuize
+from work_log.models import initialize, CREATE_TASKS, ALL_TASKS, TASKS_WITH_NAME, LATEST_DAY
+from work_log.profiling import profiler, step_name
+
+
+class ProfilerTests(TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        initialize(self.db)
+        CREATE_TASKS({"name": "nic", "notes": "note", "minutes": n} for n in range(5))
+        profiler.reset()
+        profiler.enable(self.db, slow_ms=10000)
+
+    def tearDown(self):
+        profiler.disable()
+        profiler.reset()
+        self.db.close()
+
+    def stats(self, query):
+        return profiler.queries[query.sql()[0]]
+
+    def test_query_rows_and_time(self):
+        query = TASKS_WITH_NAME("nic")
+        self.assertEqual(len(list(query)), 5)
+        stats = self.stats(query)
+        self.assertEqual((stats.calls, stats.rows), (1, 5))
+        self.assertGreater(stats.seconds, 0)
+
+    def test_partly_read_cursor_still_recorded(self):
+        LATEST_DAY()
+        self.assertTrue(any(sql.startswith('SELECT "t1"."day"') for sql in profiler.queries))
+
+    def test_slow_query_logs_plan(self):
+        profiler.slow_ms = 0
+        with self.assertLogs("work_log.profiling") as logs:
+            list(ALL_TASKS())
+        self.assertIn("plan: SCAN", logs.output[0])
+
+    def test_dropped_cursor_logged_without_plan(self):
+        profiler.slow_ms = 0
+        with self.assertLogs("work_log.profiling") as logs:
+            cursor = self.db.execute_sql('SELECT * FROM "task"')
+            cursor.fetchone()
+            del cursor
+            gc.collect()
+        self.assertIn("plan: not looked up for a dropped cursor", logs.output[0])
+
+    def test_enable_replaces_the_log(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        paths = [os.path.join(directory, name) for name in ["first.log", "second.log"]]
+        profiler.enable(self.db, log_path=paths[0])
+        first = profiler.handler
+        profiler.enable(self.db, log_path=paths[1])
+        log = logging.getLogger("work_log.profiling")
+        self.assertListEqual(log.handlers, [profiler.handler])
+        self.assertEqual(profiler.handler.baseFilename, paths[1])
+        self.assertIsNone(first.stream)
+        profiler.disable()
+        self.assertListEqual(log.handlers, [])
+
+    def test_disable_restores_database(self):
+        profiler.disable()
+        list(ALL_TASKS())
+        self.assertDictEqual(profiler.queries, {})
+        self.assertNotIn("execute_sql", vars(self.db))
+
+    def test_exec_funcs_steps_timed(self):
+        def first(*args, **kwargs):
+            return kwargs
+        second = menuize.partial(first)
+        menuize.exec_funcs(func_list=[first, second, first])
+        self.assertEqual(profiler.steps["first"].calls, 3)
+        self.assertEqual(step_name(second), "first")
+
+    def test_summary(self):
+        list(ALL_TASKS())
+        stream = StringIO()
+        profiler.report(stream)
+        self.assertIn("statements", stream.getvalue())
+        self.assertIn('FROM "task"', stream.getvalue())
+
+
+if __name__ == '__main__':
+    main()
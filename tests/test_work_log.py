@@ -0,0 +1,138 @@
+import datetime
+import shutil
+import tempfile
+from io import StringIO
+from unittest import TestCase, main, mock
+
+from peewee import SqliteDatabase
+
+from work_log import menuize, work_log
+from work_log.models import initialize, archive, ALL_TASKS, CREATE_TASK
+
+
+class BatchAddTests(TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        initialize(self.db)
+        self.terminal = menuize.HeadlessTerminal(height=100)
+
+    def tearDown(self):
+        self.db.close()
+
+    def batch_add(self, answers, notes=()):
+        with mock.patch('work_log.menuize.terminal', self.terminal), \
+             mock.patch('sys.stdout', new_callable=StringIO), \
+             mock.patch('builtins.input', side_effect=answers), \
+             mock.patch('sys.stdin') as stdin:
+            stdin.read.side_effect = list(notes)
+            with self.assertRaises(menuize.EndOption):
+                work_log.batch_add()
+
+    def test_saves_every_task_at_once(self):
+        self.batch_add(["a", "nic", "30", "a", "dave", "x", "a", "dave", "45", "s"],
+                       ["first\nsecond line", "lost", "Third"])
+        tasks = ALL_TASKS()
+        self.assertListEqual([(task['name'], task['notes'], task['minutes']) for task in tasks],
+                             [("nic", "first\nsecond line", 30), ("dave", "third", 45)])
+        screens = self.terminal.stream.getvalue()
+        self.assertIn("durations are whole minutes, that task was not added", screens)
+        self.assertIn("  1) nic, 30 minutes: first", screens)
+        self.assertIn("1 tasks, 30 minutes", screens)
+
+    def test_cancel_saves_nothing(self):
+        self.batch_add(["a", "nic", "30", "c"], ["notes"])
+        self.assertEqual(len(ALL_TASKS()), 0)
+
+    def test_typed_ahead_batch(self):
+        menuize.type_ahead('b a nic "fixed it" 30 a dave notes 45 s')
+        self.batch_add([])
+        self.assertListEqual([(task['name'], task['notes']) for task in ALL_TASKS()],
+                             [("nic", "fixed it"), ("dave", "notes")])
+
+    def test_interrupt_saves_nothing(self):
+        self.batch_add(["a", "nic", "30", KeyboardInterrupt()], ["notes"])
+        self.assertEqual(len(ALL_TASKS()), 0)
+
+
+class SearchTasksTests(TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        initialize(self.db)
+        self.terminal = menuize.HeadlessTerminal(height=100)
+        for name in ["nic", "nina"]:
+            CREATE_TASK({"name": name, "notes": "notes", "minutes": 30})
+
+    def tearDown(self):
+        self.db.close()
+
+    def search(self, answers):
+        with mock.patch('work_log.menuize.terminal', self.terminal), \
+             mock.patch('sys.stdout', new_callable=StringIO) as stdout, \
+             mock.patch('builtins.input', side_effect=answers):
+            with self.assertRaises(menuize.EndOption):
+                work_log.search_tasks()
+        return stdout.getvalue() + self.terminal.stream.getvalue()
+
+    def test_name_search_asks_again_until_one_name_matches(self):
+        screens = self.search(["x", "n", "ni", "nic", ""])
+        self.assertIn("BAD INPUT", screens)
+        self.assertIn("1 task found", screens)
+        self.assertIn("1 nic ", screens)
+        self.assertNotIn("2 nina ", screens)
+
+    def test_typed_ahead_search_skips_the_menus(self):
+        menuize.type_ahead("s n nic")
+        screens = self.search([""])
+        self.assertIn("1 task found", screens)
+        self.assertNotIn("What would you like to search by?", screens)
+
+    def test_typed_ahead_date_range(self):
+        today = datetime.date.today().isoformat()
+        menuize.type_ahead('s d 2019-01-01 {}'.format(today))
+        screens = self.search([""])
+        self.assertIn("2 tasks found", screens)
+        self.assertNotIn("Days with tasks", screens)
+
+    def test_typed_ahead_phrase_and_time_range(self):
+        CREATE_TASK({"name": "kim", "notes": "invoice client", "minutes": 90})
+        CREATE_TASK({"name": "kim", "notes": "invoice", "minutes": 300})
+        menuize.type_ahead("s p invoice client")
+        self.assertIn("1 task found", self.search([""]))
+        menuize.type_ahead("s t 30 - 240")
+        self.assertIn("3 tasks found", self.search([""]))
+        self.assertEqual(len(menuize.answers), 0)
+
+    def test_each_search_runs_its_own_branch(self):
+        self.assertIn("2 tasks found", self.search(["a", ""]))
+        self.assertIn("2 tasks found", self.search(["t", "30", ""]))
+        self.assertIn("1 task found", self.search(["n", "nina", ""]))
+
+
+class ArchivedSearchTests(TestCase):
+    db = SqliteDatabase(":memory:")
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        initialize(self.db)
+        self.terminal = menuize.HeadlessTerminal(height=100)
+        CREATE_TASK({"name": "dave", "notes": "old notes", "minutes": 45, "timestamp": "2017-03-01"})
+        # the newest task always stays live
+        CREATE_TASK({"name": "nic", "notes": "notes", "minutes": 30})
+        archive(datetime.date(2018, 1, 1), directory=self.directory)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    search = SearchTasksTests.search
+
+    def test_searches_read_archived_years(self):
+        self.assertIn("1 task found", self.search(["n", "dave", ""]))
+        self.assertIn("2 tasks found", self.search(["a", ""]))
+        self.assertIn("1 task found", self.search(["t", "45", ""]))
+        self.assertIn("old notes", self.search(["p", "old", ""]))
+
+if __name__ == '__main__':
+    main()
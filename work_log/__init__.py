@@ -1 +1,21 @@
-from .work_log import *
\ No newline at end of file
+"""The WorkLog: log and search tasks from a menu or the command line.
+
+Submodules load on first attribute access, so `import work_log` is cheap
+and `work_log.main()` only pulls in what the chosen command needs.
+"""
+import importlib
+
+SUBMODULES = ("async_models", "backup", "cli", "menuize", "models", "parallel", "profiling", "work_log")
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    if name == "main":
+        return importlib.import_module(".cli", __name__).main
+    # everything else is what `from .work_log import *` used to export
+    module = importlib.import_module(".work_log", __name__)
+    try:
+        return getattr(module, name)
+    except AttributeError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""asyncio front for work_log.models
+
+Every helper here is a coroutine that runs its models counterpart on a
+bounded thread pool and reads the rows there. A slow search then ties up
+one worker, and the event loop keeps serving other sessions. peewee gives
+each worker thread its own connection to the bound database, so the
+database must be a file: each connection to ':memory:' gets its own empty
+database.
+"""
+import asyncio
+import threading
+from functools import wraps, partial
+from concurrent.futures import ThreadPoolExecutor
+
+from . import models
+
+MAX_WORKERS = 4
+
+pool = None
+workers = 0
+
+
+def configure(max_workers=MAX_WORKERS):
+    """replaces the worker pool, letting running work finish on the old one"""
+    global pool, workers
+    if pool is not None:
+        close_connections(pool, workers)
+        pool.shutdown(wait=False)
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="work_log-db")
+    workers = max_workers
+    return pool
+
+def shutdown():
+    global pool
+    if pool is not None:
+        for closing in close_connections(pool, workers):
+            closing.result()
+        pool.shutdown(wait=True)
+        pool = None
+
+def close_connection(barrier):
+    # every worker waits for the others, so each closes its own thread's
+    # connection rather than one closing twice
+    barrier.wait()
+    models.Task._meta.database.close()
+
+def close_connections(pool, workers):
+    """queues a close of each of pool's worker connections behind the work
+    already queued, returning their futures"""
+    barrier = threading.Barrier(workers)
+    return [pool.submit(close_connection, barrier) for _ in range(workers)]
+
+def materialize(func, *args, **kwargs):
+    """calls func, reading any lazy query it returns before leaving the worker"""
+    result = func(*args, **kwargs)
+    if isinstance(result, (list, tuple, dict, str)) or not hasattr(result, '__iter__'):
+        return result
+    return list(result)
+
+async def run_sync(func, *args, **kwargs):
+    """runs any blocking database call, such as a pages() cursor step, on the pool"""
+    if pool is None:
+        configure()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, partial(materialize, func, *args, **kwargs))
+
+def asynchronous(func):
+    @wraps(func)
+    async def inner(*args, **kwargs):
+        return await run_sync(func, *args, **kwargs)
+    return inner
+
+
+CREATE_TASK = asynchronous(models.CREATE_TASK)
+CREATE_TASKS = asynchronous(models.CREATE_TASKS)
+ALL_TASKS = asynchronous(models.ALL_TASKS)
+ALL_NAMES = asynchronous(models.ALL_NAMES)
+NAMES_MATCHING = asynchronous(models.NAMES_MATCHING)
+NAMES_STARTING = asynchronous(models.NAMES_STARTING)
+COUNT_NAMES_STARTING = asynchronous(models.COUNT_NAMES_STARTING)
+COUNT_NAMES_MATCHING = asynchronous(models.COUNT_NAMES_MATCHING)
+NAME_EXISTS = asynchronous(models.NAME_EXISTS)
+ALL_DATES = asynchronous(models.ALL_DATES)
+TASKS_WITH_DURATION = asynchronous(models.TASKS_WITH_DURATION)
+TASKS_LASTING = asynchronous(models.TASKS_LASTING)
+TASK_WITH_ID = asynchronous(models.TASK_WITH_ID)
+TASKS_WITH_NAME = asynchronous(models.TASKS_WITH_NAME)
+TASKS_WITH_DATE = asynchronous(models.TASKS_WITH_DATE)
+TASKS_IN_RANGE = asynchronous(models.TASKS_IN_RANGE)
+TASKS_CONTAINING = asynchronous(models.TASKS_CONTAINING)
+TASKS_MATCHING = asynchronous(models.TASKS_MATCHING)
+DAILY_TOTALS = asynchronous(models.DAILY_TOTALS)
+WEEKLY_TOTALS = asynchronous(models.WEEKLY_TOTALS)
+EMPLOYEE_TOTALS = asynchronous(models.EMPLOYEE_TOTALS)
+DAYS_WITH_TASKS = asynchronous(models.DAYS_WITH_TASKS)
+LATEST_DAY = asynchronous(models.LATEST_DAY)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Online backups through sqlite's backup API, copied a few pages at a time
+with a pause between batches so that the menu and other writers keep
+getting the database, and checks that a backup restores to what it copied.
+
+    result = backup(db, "backups/work_log.db", progress=print)
+    problems = verify(db, "backups/work_log.db", result.data_version)
+
+A write from another connection while a backup runs makes sqlite start
+copying again, so backups of a busy database take longer but are never torn.
+Archived years are copied beside the backup, e.g. backups/work_log_2019.db,
+and the backup's archive table points at those copies.
+"""
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from hashlib import blake2b
+from time import perf_counter, sleep
+from urllib.parse import quote
+
+# pages copied per step, 400 KiB with sqlite's default 4 KiB pages
+BACKUP_PAGES = 100
+# seconds between steps, when writers waiting on the database get their turn
+BACKUP_PAUSE = 0.01
+
+
+# bytes copied, archives included, the seconds it took and the source
+# connection's PRAGMA data_version once the main file was copied
+Backup = namedtuple("Backup", "bytes seconds data_version")
+# columns compared by verify() where a backup's rows differ on purpose:
+# archive paths point at the backed up copies
+COMPARED = {"archive": "year, tasks"}
+
+
+class ChangedSinceBackup(Exception):
+    """the database was written after the backup was taken, so the two can't
+    be compared"""
+
+
+def open_read_only(path):
+    return sqlite3.connect("file:{}?mode=ro".format(quote(os.path.abspath(path))), uri=True)
+
+def archive_copy_path(path, year):
+    """names a backed up year after the backup, as archive_path() does"""
+    stem, extension = os.path.splitext(os.path.abspath(path))
+    return "{}_{}{}".format(stem, year, extension or ".db")
+
+def archives(connection):
+    """returns (year, path) of each year a connection's database archived"""
+    if "archive" not in tables(connection):
+        return []
+    return connection.execute("SELECT year, path FROM archive ORDER BY year").fetchall()
+
+def copy(source, path, pages, pause, progress=None):
+    """copies the source connection's main database into a new connection
+    at path, pages at a time with pause seconds between steps; returns the
+    open copy and the bytes copied"""
+    page_size = source.execute("PRAGMA page_size").fetchone()[0]
+    totals = [0]
+    def step(status, remaining, total):
+        totals[0] = total
+        if progress:
+            progress(total - remaining, total)
+        if remaining:
+            sleep(pause)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target, pages=pages, progress=step)
+    except BaseException:
+        target.close()
+        raise
+    return target, totals[0] * page_size
+
+def backup(database, path, pages=BACKUP_PAGES, pause=BACKUP_PAUSE, progress=None):
+    """copies database and each year it archived to path, pages at a time
+    with pause seconds between steps, calling progress(copied_pages,
+    total_pages) after each step of the main file
+
+    Every file is written beside its name and renamed over it once
+    complete, so path always holds a whole backup. Returns a Backup.
+    """
+    if os.path.abspath(path) == os.path.abspath(database.database):
+        raise ValueError("{} is the database being backed up".format(path))
+    source = database.connection()
+    partials = []
+    start = perf_counter()
+    try:
+        partials.append(path + ".partial")
+        target, copied = copy(source, partials[-1], pages, pause, progress)
+        try:
+            data_version = source.execute("PRAGMA data_version").fetchone()[0]
+            for year, original in archives(target):
+                copy_path = archive_copy_path(path, year)
+                if os.path.abspath(original) == copy_path:
+                    raise ValueError("{} is an archive being backed up".format(copy_path))
+                partials.append(copy_path + ".partial")
+                archived = open_read_only(original)
+                try:
+                    archive_copy, size = copy(archived, partials[-1], pages, pause)
+                    archive_copy.close()
+                finally:
+                    archived.close()
+                copied += size
+                target.execute("UPDATE archive SET path = ? WHERE year = ?", (copy_path, year))
+            target.commit()
+        finally:
+            target.close()
+        for partial in reversed(partials):
+            os.replace(partial, partial[:-len(".partial")])
+    except BaseException:
+        for partial in partials:
+            if os.path.exists(partial):
+                os.remove(partial)
+        raise
+    return Backup(copied, perf_counter() - start, data_version)
+
+def tables(connection):
+    """returns the names of the ordinary tables of a connection's main
+    database, the full-text index's own included"""
+    return [name for name, in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+        "AND sql NOT LIKE 'CREATE VIRTUAL%' ORDER BY name")]
+
+def checksums(connection):
+    """returns {table: (rows, checksum)} for every table of connection"""
+    sums = {}
+    for table in tables(connection):
+        digest = blake2b(digest_size=16)
+        rows = 0
+        # a full scan walks the table's b-tree, so rows come in key order
+        # however the pages holding them are laid out
+        for row in connection.execute('SELECT {} FROM "{}"'.format(COMPARED.get(table, "*"), table)):
+            digest.update(repr(row).encode())
+            rows += 1
+        sums[table] = (rows, digest.hexdigest())
+    return sums
+
+def restored_checksums(path, scratch):
+    """restores the file at path to scratch and returns its quick_check
+    result and checksums"""
+    restored = sqlite3.connect(scratch)
+    try:
+        copied = open_read_only(path)
+        try:
+            copied.backup(restored)
+        finally:
+            copied.close()
+        check = restored.execute("PRAGMA quick_check").fetchone()[0]
+        return check, checksums(restored) if check == "ok" else None
+    finally:
+        restored.close()
+
+def compare(live, backed_up, label=""):
+    """returns the differences between two files' checksums"""
+    problems = []
+    for table in sorted(set(live) | set(backed_up)):
+        if table not in backed_up:
+            problems.append("{}{}: missing from the backup".format(label, table))
+        elif table not in live:
+            problems.append("{}{}: only in the backup".format(label, table))
+        elif live[table][0] != backed_up[table][0]:
+            problems.append("{}{}: {} rows, the backup has {}".format(
+                label, table, live[table][0], backed_up[table][0]))
+        elif live[table][1] != backed_up[table][1]:
+            problems.append("{}{}: rows differ from the backup".format(label, table))
+    return problems
+
+def verify(database, path, data_version=None):
+    """restores the backup at path and its archived years into scratch
+    files and compares their row counts and checksums with database's,
+    table by table; returns a list of problems, empty when the backup
+    matches
+
+    Given the data_version backup() returned, raises ChangedSinceBackup
+    rather than comparing when the database was written since, once the
+    copies are found intact. PRAGMA data_version is per connection, so that
+    takes the thread the backup ran on.
+    """
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        check, backed_up = restored_checksums(path, os.path.join(directory, "restored.db"))
+        if check != "ok":
+            return ["restored copy is damaged: {}".format(check)]
+        copied = open_read_only(path)
+        try:
+            copies = dict(archives(copied))
+        finally:
+            copied.close()
+        # one read transaction, so every table is read as of the same moment
+        with database.atomic():
+            connection = database.connection()
+            changed = (data_version is not None and
+                       connection.execute("PRAGMA data_version").fetchone()[0] != data_version)
+            live = None if changed else checksums(connection)
+            originals = archives(connection)
+        problems = [] if changed else compare(live, backed_up)
+        for year, original in originals:
+            label = "{} ".format(os.path.basename(original))
+            if year not in copies:
+                problems.append("{}: missing from the backup".format(original))
+                continue
+            check, backed_up = restored_checksums(
+                copies[year], os.path.join(directory, "restored_{}.db".format(year)))
+            if check != "ok":
+                problems.append("{}restored copy is damaged: {}".format(label, check))
+                continue
+            archived = open_read_only(original)
+            try:
+                problems.extend(compare(checksums(archived), backed_up, label))
+            finally:
+                archived.close()
+    if changed and not problems:
+        raise ChangedSinceBackup("{} was written since the backup".format(database.database))
+    return problems
+
+
+class BackupThread(threading.Thread):
+    """backs a database up to path every interval seconds over a connection
+    of its own, and once more when stopped"""
+
+    def __init__(self, database, path, interval, **options):
+        super().__init__(name="backup", daemon=True)
+        self.database = database
+        self.path = path
+        self.interval = interval
+        self.options = options
+        self.stopped = threading.Event()
+        # the Backup of the latest backup, and the error of the latest attempt
+        self.last = None
+        self.error = None
+
+    def run(self):
+        try:
+            while True:
+                stopping = self.stopped.wait(self.interval)
+                try:
+                    self.last = backup(self.database, self.path, **self.options)
+                    self.error = None
+                except (sqlite3.Error, OSError, ValueError) as err:
+                    self.error = err
+                if stopping:
+                    break
+        finally:
+            self.database.close()
+
+    def stop(self):
+        """takes the last backup and waits for it"""
+        self.stopped.set()
+        self.join()
+
+    def summary(self):
+        if self.error:
+            return "backup to {} failed: {}".format(self.path, self.error)
+        if not self.last:
+            return "no backup taken"
+        return describe(self.path, self.last.bytes, self.last.seconds)
+
+def describe(path, copied, seconds):
+    """returns a line giving a backup's size and throughput"""
+    return "backed up {:.1f} MiB to {} in {:.2f}s ({:.1f} MiB/s)".format(
+        copied / 2 ** 20, path, seconds, copied / 2 ** 20 / max(seconds, 1e-9))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import csv
+import json
+import argparse
+import datetime
+
+# peewee, the models and the menus are imported by the commands that use
+# them, so that --help and argument errors return without loading them
+
+
+def read_csv(handle):
+    """yields a task dict per csv row, keyed by the header line"""
+    yield from csv.DictReader(handle)
+
+def read_jsonl(handle):
+    """yields a task dict per non-blank json line"""
+    for line in handle:
+        if line.strip():
+            yield json.loads(line)
+
+readers = {
+    ".csv": read_csv,
+    ".jsonl": read_jsonl,
+}
+
+def write_jsonl(query, out, header=True):
+    # jsonl has no header line
+    for row in query.dicts().iterator():
+        out.write(json.dumps(row, default=str) + "\n")
+
+def write_csv(query, out, header=True):
+    from .models import TASK_FIELDS
+    writer = csv.writer(out, lineterminator="\n")
+    if header:
+        writer.writerow(('id',) + TASK_FIELDS)
+    # plain tuples in select order, the cheapest rows peewee builds
+    writer.writerows(query.tuples().iterator())
+
+writers = {
+    "jsonl": write_jsonl,
+    "csv": write_csv,
+}
+
+def iso_date(text):
+    return datetime.datetime.strptime(text, "%Y-%m-%d").date()
+
+def chosen_database(args):
+    """returns the --database file if one was given, else the default"""
+    from peewee import SqliteDatabase
+    from .models import db
+    return SqliteDatabase(args.database) if args.database else db
+
+def open_database(args):
+    """initializes the --database file if one was given, else the default"""
+    from .models import initialize
+    database = chosen_database(args)
+    start_profiling(args, database)
+    initialize(database, profile="performance")
+    return database
+
+def start_profiling(args, database):
+    """times the database's queries and the menu steps when --profile is given"""
+    if args.profile:
+        from .profiling import profiler
+        profiler.enable(database, slow_ms=args.slow_ms, log_path=args.slow_log)
+
+def import_tasks(args):
+    reader = readers.get(os.path.splitext(args.file)[1].lower())
+    if not reader:
+        sys.exit("import expects a .csv or .jsonl file")
+    from .models import CREATE_TASKS
+    try:
+        with open(args.file, newline="") as handle:
+            created = CREATE_TASKS(reader(handle), batch_size=args.batch_size)
+    except ValueError as err:
+        sys.exit("{}: {}".format(args.file, err))
+    print("imported {} tasks".format(created))
+
+def stream(args, **filters):
+    """writes the tasks matching the TASKS_MATCHING filters to stdout as
+    they come off the cursor, or as --workers processes format them"""
+    from .models import TASKS_MATCHING, Task
+    write = writers[args.format]
+    path = Task._meta.database.database
+    # ranked phrase matches are not in id order, so they can't be split by id
+    ranked = filters.get('phrase') and not any(filters.get(key) for key in ['start', 'end', 'archived'])
+    try:
+        if args.workers > 1 and not ranked and path != ":memory:":
+            from .parallel import write_parallel
+            write_parallel(path, filters, write, sys.stdout, args.workers)
+        else:
+            write(TASKS_MATCHING(**filters), sys.stdout)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # the reader went away, as with | head; stop without a traceback
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+def search_tasks(args):
+    stream(args, 
+        name=args.name, 
+        phrase=args.phrase, 
+        start=args.date_from, 
+        end=args.date_to, 
+        duration=args.duration,
+        shortest=args.min_duration,
+        longest=args.max_duration,
+        archived=args.archived,
+    )
+
+def export_tasks(args):
+    stream(args, archived=args.archived)
+
+def archive_tasks(args):
+    from .models import archive
+    try:
+        moved = archive(args.before, directory=args.directory)
+    except ValueError as err:
+        sys.exit(str(err))
+    for year, count in sorted(moved.items()):
+        print("archived {} tasks from {}".format(count, year))
+    if not moved:
+        print("nothing to archive before {}".format(args.before))
+
+def merge_databases(args):
+    from .models import merge
+    try:
+        results = merge(args.files, batch_size=args.batch_size)
+    except ValueError as err:
+        sys.exit(str(err))
+    for path, (merged, skipped) in results.items():
+        print("merged {} tasks from {}, skipped {} already here".format(merged, path, skipped))
+
+def backup_database(args):
+    from .backup import backup, verify, describe, ChangedSinceBackup
+    from .models import Task
+    database = Task._meta.database
+    def progress(copied, total):
+        sys.stderr.write("\r{:5.1f}% of {} pages".format(100 * copied / max(total, 1), total))
+    try:
+        result = backup(database, args.path, pages=args.pages, 
+                        pause=args.pause_ms / 1000, progress=progress)
+    except ValueError as err:
+        sys.exit(str(err))
+    sys.stderr.write("\n")
+    print(describe(args.path, result.bytes, result.seconds))
+    if args.verify:
+        try:
+            problems = verify(database, args.path, result.data_version)
+        except ChangedSinceBackup:
+            print("changed since backup: the copy restores intact but can't be compared")
+            return
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit("the backup does not match the database")
+        print("verified: a restored copy matches the database")
+
+def maintain_database(args):
+    from .models import maintain
+    before, after = maintain()
+    print("{:.1f} MiB -> {:.1f} MiB".format(before / 2 ** 20, after / 2 ** 20))
+
+def parser():
+    parser = argparse.ArgumentParser(description="Log and search tasks in the WorkLog.")
+    parser.add_argument("--database", help="sqlite file to use instead of work_log.db")
+    parser.add_argument("--profile", action="store_true", 
+                        help="time every query and menu step, printing a summary on exit")
+    parser.add_argument("--slow-ms", type=float, default=100, 
+                        help="log the plan of queries slower than this when profiling")
+    parser.add_argument("--slow-log", help="file for the slow query log, stderr by default")
+    parser.add_argument("--backup-to", help="back the menu's database up to this file in the background")
+    parser.add_argument("--backup-minutes", type=float, default=60, 
+                        help="minutes between background backups, one more being taken on quitting")
+    commands = parser.add_subparsers(dest="command")
+
+    importer = commands.add_parser("import", help="bulk load tasks from a csv or jsonl file")
+    importer.add_argument("file", help="file with name, notes, minutes (or duration in hours) and optional timestamp")
+    importer.add_argument("--batch-size", type=int, default=5000, help="rows per transaction")
+    importer.set_defaults(func=import_tasks)
+
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--format", choices=sorted(writers), default="jsonl")
+    output.add_argument("--archived", action="store_true", 
+                        help="also read archived years when no dates are given")
+    output.add_argument("--workers", type=int, default=1, 
+                        help="processes formatting id ranges side by side, for large exports")
+
+    search = commands.add_parser("search", parents=[output], 
+                                 help="write the tasks matching every filter given to stdout")
+    search.add_argument("--name", help="exact employee name")
+    search.add_argument("--phrase", help="words in the name or notes")
+    search.add_argument("--date-from", type=iso_date, help="first day, YYYY-MM-DD")
+    search.add_argument("--date-to", type=iso_date, help="last day, YYYY-MM-DD")
+    search.add_argument("--duration", type=int, help="duration in minutes")
+    search.add_argument("--min-duration", type=int, help="shortest duration in minutes")
+    search.add_argument("--max-duration", type=int, help="longest duration in minutes")
+    search.set_defaults(func=search_tasks)
+
+    export = commands.add_parser("export", parents=[output], help="write every task to stdout")
+    export.set_defaults(func=export_tasks)
+
+    archiver = commands.add_parser("archive", help="move tasks before a day into one file per year")
+    archiver.add_argument("--before", type=iso_date, required=True, help="first day kept, YYYY-MM-DD")
+    archiver.add_argument("--directory", help="where the yearly files go, beside the database by default")
+    archiver.set_defaults(func=archive_tasks)
+
+    merger = commands.add_parser("merge", help="copy in the tasks of other work log files, skipping duplicates")
+    merger.add_argument("files", nargs="+", help="work log files, archived years included, to read")
+    merger.add_argument("--batch-size", type=int, default=5000, help="rows per transaction")
+    merger.set_defaults(func=merge_databases)
+
+    backer = commands.add_parser("backup", help="copy the database while it is in use")
+    backer.add_argument("path", help="file to write the backup to")
+    backer.add_argument("--pages", type=int, default=100, help="pages copied per step")
+    backer.add_argument("--pause-ms", type=float, default=10, help="pause between steps")
+    backer.add_argument("--verify", action="store_true", 
+                        help="restore the backup to a scratch file and compare it with the database")
+    backer.set_defaults(func=backup_database)
+
+    maintainer = commands.add_parser("maintain", help="vacuum and analyze the database")
+    maintainer.set_defaults(func=maintain_database)
+    return parser
+
+def main(argv=None):
+    """runs a subcommand, or the interactive menu when none is given"""
+    args = parser().parse_args(argv)
+    try:
+        if args.command is None:
+            from .work_log import run
+            database = chosen_database(args)
+            start_profiling(args, database)
+            return run(database, backup_to=args.backup_to, backup_minutes=args.backup_minutes)
+        db = open_database(args)
+        try:
+            return args.func(args)
+        finally:
+            db.close()
+    finally:
+        if args.profile:
+            from .profiling import profiler
+            profiler.report()
+            profiler.disable()
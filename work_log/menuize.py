@@ -1,25 +1,144 @@
 import re
 import sys
-import os
-from collections import OrderedDict
-from functools import wraps, reduce, partial
+import shlex
+import shutil
+import datetime
+from io import StringIO
+from collections import OrderedDict, deque
+from functools import wraps, partial, lru_cache
+
+from .profiling import profiler, timed_step, timed_step_async
 
 class EndOption(Exception):
     """Ends an option chain"""
     def __init__(self, message):
         self.message = message
 
+class AnsiTerminal:
+    """draws whole screens with ANSI escape sequences in a single write,
+    rewriting only the lines that changed since the previous screen"""
+    HOME = "\x1b[H"
+    ERASE_BELOW = "\x1b[J"
+    ERASE_LINE = "\x1b[K"
+
+    def __init__(self, stream=None, height=None):
+        self.stream = stream
+        self.height = height
+        # lines known to be on screen, from the top; cleared when anything
+        # other than draw() may have written to the terminal
+        self.lines = []
+
+    def rows(self):
+        return self.height or shutil.get_terminal_size().lines
+
+    def write(self, data):
+        stream = self.stream or sys.stdout
+        stream.write(data)
+        stream.flush()
+
+    def clear(self):
+        self.lines = []
+        self.write(self.HOME + self.ERASE_BELOW)
+
+    def draw(self, text):
+        """shows text as the whole screen, leaving the cursor after its last
+        line so that input() prompts there"""
+        lines = text.split("\n")
+        if len(lines) >= self.rows():
+            # a screen taller than the terminal scrolls, so rows can't be addressed
+            self.clear()
+            self.write(text)
+            return
+        changed = "".join(
+            "\x1b[{};1H{}{}".format(row + 1, line, self.ERASE_LINE)
+            for row, line in enumerate(lines)
+            if row >= len(self.lines) or self.lines[row] != line
+        )
+        self.write(changed + "\x1b[{};{}H{}".format(
+            len(lines), len(lines[-1]) + 1, self.ERASE_BELOW))
+        # the last line gets the user's typing, so it is redrawn next time
+        self.lines = lines[:-1]
+
+
+class HeadlessTerminal(AnsiTerminal):
+    """an AnsiTerminal writing to memory, recording the bytes of each write"""
+
+    def __init__(self, height=24):
+        super().__init__(stream=StringIO(), height=height)
+        self.frames = []
+
+    def write(self, data):
+        self.frames.append(len(data.encode()))
+        super().write(data)
+
+terminal = AnsiTerminal()
+
 def clear():
     """clears the screen"""
-    os.system('cls' if os.name == 'nt' else 'clear')
+    terminal.clear()
+
+def draw(text):
+    """shows text as the whole screen, redrawing only what changed"""
+    terminal.draw(text)
+
+# answers typed ahead of their prompts, as in "s n nic" from the main menu
+answers = deque()
 
-def pause(*args, **kwargs):
+def type_ahead(line):
+    """returns the first word of line, queueing the rest as answers for the
+    prompts that follow; quotes keep spaces in one answer
+
+    >>> type_ahead('s n "nic cage"')
+    's'
+    >>> answers.popleft(), answers.popleft()
+    ('n', 'nic cage')
+    """
+    words = shlex.split(line)
+    answers.extend(words[1:])
+    return words[0] if words else ""
+
+def ask(prompt=""):
+    """returns the next typed-ahead answer, or else asks with input()"""
+    return answers.popleft() if answers else input(prompt)
+
+def ask_rest(prompt=""):
+    """returns every typed-ahead answer left as one line, for a prompt that
+    takes free text and ends what can be typed ahead, or else asks with
+    input()
+
+    >>> type_ahead("s p invoice client")
+    's'
+    >>> ask(), ask_rest()
+    ('p', 'invoice client')
+    """
+    if not answers:
+        return input(prompt)
+    rest = " ".join(answers)
+    answers.clear()
+    return rest
+
+def context_step(func):
+    """marks a step written as func(context) that changes the context an
+    option's steps share in place, instead of taking it as keyword arguments
+    and returning a new dict
+
+    Called with keyword arguments it still works on a dict of them and
+    returns it, so it can be used like any other step.
+    """
+    @wraps(func)
+    def step(*args, **kwargs):
+        func(kwargs)
+        return kwargs
+    step.in_context = func
+    return step
+
+@context_step
+def pause(context):
     input("...   ")
-    return kwargs
 
-def clear_screen(*args, **kwargs):
+@context_step
+def clear_screen(context):
     clear()
-    return kwargs
 
 def end(*args, **kwargs):
     raise EndOption("...   ")
@@ -44,147 +163,265 @@ def normalize_func_list(chain_function, this):
     func_list[func_list.index("this")] = this
     return func_list
 
-def create_func_list_factory(chain_function, this):
-    return partial(normalize_func_list, this=this, chain_function=chain_function)
+def compile_step(step):
+    """returns (function, defaults): a context step's own function and the
+    keywords of a partial over it, or the step itself and None for a step
+    that takes keyword arguments"""
+    target = step.func if isinstance(step, partial) else step
+    in_context = getattr(target, '__dict__', {}).get('in_context')
+    if in_context is None:
+        return step, None
+    return in_context, step.keywords if isinstance(step, partial) else {}
 
-def executor(*args, **kwargs):
-    def inner(acc, cur):
-        start_check = acc.__class__.__name__
-        try:
-            if start_check in ['function', 'partial', 'Mock']:
-                acc = acc(*args, **kwargs)
-            func = cur(**acc)
-            return func
-        except EndOption as err:
-            raise 
-    return inner
+
+class Pipeline:
+    """a list of steps compiled once, with every branch that a choice_menu
+    step splices in at "*" compiled and cached the first time it is chosen
+
+    Context steps all change one dict in place. A partial's keywords are
+    defaults that the context overrides, as when they were merged into the
+    keyword arguments.
+    """
+
+    def __init__(self, steps):
+        self.steps = tuple(steps)
+        self.calls = tuple(None if step == "*" else compile_step(step) for step in self.steps)
+        self.branches = {}
+
+    def branch(self, factory):
+        """returns the pipeline with factory's steps in place of "*" """
+        if factory not in self.branches:
+            steps = list(self.steps)
+            wild_idx = steps.index("*")
+            steps[wild_idx:wild_idx + 1] = factory()
+            self.branches[factory] = Pipeline(steps)
+        return self.branches[factory]
+
+    def run(self, context):
+        """runs the steps on context, changing it in place, and returns it"""
+        pipeline, position, state = self, 0, context
+        timing = profiler.enabled
+        while position < len(pipeline.calls):
+            call = pipeline.calls[position]
+            position += 1
+            if call is None:
+                continue
+            function, defaults = call
+            if defaults is None:
+                # a keyword step hands back the dict the next step gets
+                state = timed_step(function, **state) if timing else function(**state)
+            else:
+                for key, value in defaults.items():
+                    state.setdefault(key, value)
+                if timing:
+                    timed_step(function, state)
+                else:
+                    function(state)
+            if 'branch' in state:
+                pipeline = pipeline.branch(state.pop('branch'))
+        if state is not context:
+            context.clear()
+            context.update(state)
+        return context
+
+    async def run_async(self, context):
+        """run for steps that may be coroutine functions, such as the ones in
+        async_models, awaiting each one's result before the next step"""
+        pipeline, position, state = self, 0, context
+        while position < len(pipeline.calls):
+            call = pipeline.calls[position]
+            position += 1
+            if call is None:
+                continue
+            function, defaults = call
+            if defaults is None:
+                state = await timed_step_async(function, **state)
+            else:
+                for key, value in defaults.items():
+                    state.setdefault(key, value)
+                await timed_step_async(function, state)
+            if 'branch' in state:
+                pipeline = pipeline.branch(state.pop('branch'))
+        if state is not context:
+            context.clear()
+            context.update(state)
+        return context
+
+@lru_cache(maxsize=None)
+def compile_option(chain_function, this):
+    """returns the cached pipeline of an option's steps"""
+    return Pipeline(normalize_func_list(chain_function, this))
 
 def exec_funcs(*args, **kwargs):
-    funcs_arr = kwargs['func_list']
-    return reduce(executor(*args, **kwargs), funcs_arr)
-
-def multiline_input(*args, **kwargs):
-    name = kwargs['name']
-    prompt = kwargs['prompt']
-    print(prompt)
-    if "input" not in kwargs:
-        kwargs['input'] = dict()
-    kwargs['input'][name] = sys.stdin.read().strip().lower()
-    print("")
-    # cleanup namespaces
-    del kwargs['name']
-    del kwargs['prompt']
-    return kwargs
-
-def line_input(*args, **kwargs):
-    name = kwargs['name']
-    prompt = kwargs['prompt']
-    data = input("{prompt} >>>  ".format(prompt=prompt))
-    if "input" not in kwargs:
-        kwargs['input'] = dict()
-    kwargs['input'][name] = data.lower().strip()
-    # cleanup namespaces
-    del kwargs['name']
-    del kwargs['prompt']
-    return kwargs
-
-def numerical_input(*args, **kwargs):
-    name = kwargs['name']
-    prompt = kwargs['prompt']
-    data = input("{prompt} >>>  ".format(prompt=prompt))
-    if "input" not in kwargs:
-        kwargs['input'] = dict()
-    kwargs['input'][name] = int(data.strip())
+    """runs kwargs['func_list'] as an uncached pipeline on kwargs"""
+    return Pipeline(kwargs['func_list']).run(kwargs)
+
+async def exec_funcs_async(*args, **kwargs):
+    """exec_funcs for steps that may be coroutine functions"""
+    return await Pipeline(kwargs['func_list']).run_async(kwargs)
+
+def read_input(context, name, value):
+    if "input" not in context:
+        context['input'] = dict()
+    context['input'][name] = value
     # cleanup namespaces
-    del kwargs['name']
-    del kwargs['prompt']
-    return kwargs
+    del context['name']
+    del context['prompt']
+
+@context_step
+def multiline_input(context):
+    if answers:
+        read_input(context, context['name'], answers.popleft().strip().lower())
+        return
+    print(context['prompt'])
+    read_input(context, context['name'], sys.stdin.read().strip().lower())
+    print("")
 
-def confirmed(*args, **kwargs):
-    confirm_msg = kwargs['confirm_msg']
-    input_to_confirm = kwargs['input']
-    kwargs['confirmation'] = True if input_to_confirm and input('\n{} [Yn]  '.format(confirm_msg)).strip().lower()[0] != "n" else False
-    return kwargs
+@context_step
+def line_input(context):
+    data = ask("{prompt} >>>  ".format(prompt=context['prompt']))
+    read_input(context, context['name'], data.lower().strip())
+
+@context_step
+def text_input(context):
+    """line_input for free text such as a phrase or a name, which takes the
+    whole rest of a typed-ahead line"""
+    data = ask_rest("{prompt} >>>  ".format(prompt=context['prompt']))
+    read_input(context, context['name'], data.lower().strip())
+
+@context_step
+def numerical_input(context):
+    data = ask("{prompt} >>>  ".format(prompt=context['prompt']))
+    read_input(context, context['name'], int(data.strip()))
+
+@context_step
+def date_input(context):
+    """reads a YYYY-MM-DD date, storing None for a blank answer and asking
+    again after one that isn't a date"""
+    while True:
+        data = ask("{prompt} >>>  ".format(prompt=context['prompt'])).strip()
+        try:
+            date = datetime.datetime.strptime(data, "%Y-%m-%d").date() if data else None
+            break
+        except ValueError:
+            # answers meant for a good date are dropped with it
+            answers.clear()
+            context['alert'] = "BAD INPUT  Please try again"
+            print_alert.in_context(context)
+    read_input(context, context['name'], date)
+
+@context_step
+def confirmed(context):
+    confirm_msg = context['confirm_msg']
+    input_to_confirm = context['input']
+    context['confirmation'] = True if input_to_confirm and ask('\n{} [Yn]  '.format(confirm_msg)).strip().lower()[0] != "n" else False
+
+def format_row(template, row):
+    """formats a dict or namedtuple row by field name on its own line, and a
+    plain tuple such as a menu option positionally"""
+    if hasattr(row, '_fields'):
+        return "\n" + template.format(**row._asdict())
+    if isinstance(row, tuple):
+        return template.format(*row)
+    return "\n" + template.format(**row)
 
 def list_string(*args, **kwargs):
-    string = ""
-    if 'title' in kwargs:
-        string += kwargs['title']
-        string += "\n\n"
-    for row in kwargs['list']:
-        if isinstance(row, tuple):
-            string += kwargs['item_template'].format(*row)
-        else:
-            string += "\n"
-            string += kwargs['item_template'].format(**row)
-    string += "\n___________________________________________________"
-    string += "\n"
-    return string
+    template = kwargs['item_template']
+    title = kwargs['title'] + "\n\n" if 'title' in kwargs else ""
+    items = "".join(map(partial(format_row, template), kwargs['list']))
+    return "".join([title, items, "\n___________________________________________________\n"])
 
-def list_print(*args, **kwargs):
+@context_step
+def list_print(context):
     print(
-        list_string(**kwargs)
+        list_string(**context)
     )
-    del kwargs['title']
-    del kwargs['item_template']
-    return kwargs
-
-def print_choice_menu(**kwargs):
-    kwargs = list_print(
-        item_template="{}) {}\n",
-        list=kwargs['option_list'],
-        **kwargs
-    )
-    del kwargs['list']
-    del kwargs['option_list']
-    return kwargs
-
-def print_alert(**kwargs):
-    if 'alert' in kwargs:
-        print("::: {} :::".format(kwargs['alert']))
-        del kwargs['alert']
-    return kwargs
-
-def merge_option_branch(option_branch, kwargs):
-    func_list = kwargs['func_list_factory']()
-    wild_idx = func_list.index("*")
-    func_list[wild_idx:wild_idx + 1] = option_branch
-    kwargs['func_list'][:] = func_list
-    return kwargs
-
-def choice_menu(*args, **kwargs):
-    options = OrderedDict(kwargs['options'])
-    name = kwargs['name']
-    backup = kwargs['title'], kwargs['name'], kwargs['prompt']
-    kwargs = print_alert(**kwargs)
-    kwargs = line_input(
-        **print_choice_menu(
-            option_list=option_titles(options), 
-            **kwargs
-        )
-    )
-    option = kwargs['input'][name][0]
+    del context['title']
+    del context['item_template']
 
-    if option == "q":
-        sys.exit("GOODBYE")
-    if option not in options.keys():
-        kwargs['title'], kwargs['name'], kwargs['prompt'] = backup
-        kwargs['alert'] = "::: BAD INPUT  Please try again :::"
+@context_step
+def page_print(context):
+    """prints one page of context['pages'] at a time until the user is done
+
+    pages(cursor) returns (rows, previous_cursor, next_cursor); a cursor of
+    None asks for the first page and marks the ends.
+    """
+    pages = context['pages']
+    rows, previous, following = pages(None)
+    while True:
+        moves = [(key, label) for key, label, cursor in 
+                 [("p", "previous", previous), ("n", "next", following)] if cursor is not None]
+        draw("\n".join([
+            list_string(title=context['title'], item_template=context['item_template'], list=rows),
+            " ".join(["{}) {}".format(*move) for move in moves] + ["...   "]),
+        ]))
+        choice = input().strip().lower()[:1]
+        if choice == "p" and previous is not None:
+            rows, previous, following = pages(previous)
+        elif choice == "n" and following is not None:
+            rows, previous, following = pages(following)
+        elif not choice or choice not in "pn":
+            break
+    del context['title']
+    del context['item_template']
+    del context['pages']
+
+@context_step
+def print_choice_menu(context):
+    context['item_template'] = "{}) {}\n"
+    context['list'] = context['option_list']
+    list_print.in_context(context)
+    del context['list']
+    del context['option_list']
+
+@context_step
+def print_alert(context):
+    if 'alert' in context:
+        print("::: {} :::".format(context['alert']))
+        del context['alert']
+
+@context_step
+def choice_menu(context):
+    """asks for one of context['options'] and leaves its branch factory in
+    context['branch'] for the running pipeline to splice in at "*"
+
+    A typed-ahead answer is taken without showing the menu, and words after
+    the choice are queued for the steps that follow.
+    """
+    options = OrderedDict(context['options'])
+    name = context['name']
+    while True:
+        if answers:
+            choice = answers.popleft()
+        else:
+            print_alert.in_context(context)
+            print(list_string(title=context['title'], item_template="{}) {}\n",
+                              list=option_titles(options)))
+            try:
+                choice = type_ahead(input("{} >>>  ".format(context['prompt'])))
+            except ValueError:
+                choice = ""
+        option = choice.strip().lower()[:1]
+        if option == "q":
+            sys.exit("GOODBYE")
+        if option in options:
+            break
+        # answers meant for another choice are dropped with it
+        answers.clear()
+        context['alert'] = "::: BAD INPUT  Please try again :::"
         clear()
-        return choice_menu(**kwargs)
 
-    choice_funcs = options[option]()
-    return merge_option_branch(choice_funcs, kwargs)
+    context.pop('alert', None)
+    del context['title']
+    read_input(context, name, choice.strip().lower())
+    context['branch'] = options[option]
 
 def option(chain_function):
-    """takes func_list and args"""
+    """runs the option's steps, compiled once, with func in place of "this" """
     def middle(func):
         @wraps(func)
         def inner(*args, **kwargs):
-            factory = create_func_list_factory(chain_function, func)
-            kwargs['func_list_factory'] = factory
-            kwargs['func_list'] = factory()
-            return exec_funcs(**kwargs)
+            return compile_option(chain_function, func).run(kwargs)
         return inner
     return middle
 
@@ -210,8 +447,9 @@ class Menu:
         return self.prompt_string.format(option_list=", ".join([l for l, _ in self.options.items()]))
 
     def input_to_option(self, raw_option):
-        """takes string input and returns corresponding index and func"""
-        option = raw_option.strip().lower()[0]
+        """takes string input and returns corresponding index and func,
+        queueing any words after the option as answers for its prompts"""
+        option = type_ahead(raw_option).lower()[0]
         if option == "q":
             sys.exit(self.exit_text)
         if option not in self.options:
@@ -226,12 +464,16 @@ class Menu:
         """runs the menu loop"""
         alert = None
         while True:
-            clear()
-            print(self.alert_display(alert))
-            print(self.print_menu())
-            print(self.prompt_text())
+            draw("\n".join([
+                self.alert_display(alert),
+                self.print_menu(),
+                self.prompt_text(),
+                ">>>  ",
+            ]))
             alert = None
-            raw_option = input(">>>  ")
+            # answers left over from the last option are not for this one
+            answers.clear()
+            raw_option = input()
             try:
                 option = self.input_to_option(raw_option)
             except SystemExit as err:
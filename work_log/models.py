@@ -1,62 +1,1001 @@
 #!/usr/bin/env python3
 
-import unittest
+import os
+import re
+import threading
+import bisect
 import datetime
+from contextlib import contextmanager
 from functools import wraps
+from hashlib import blake2b
+from collections import OrderedDict
+from itertools import islice
 
 from peewee import *
+from playhouse.sqlite_ext import FTS5Model, SearchField, RowIDField
  
 db = SqliteDatabase('work_log.db')
 
+# stored in PRAGMA user_version once initialize() has built the schema; bump
+# it whenever a table, index or trigger changes so existing files get migrated
+SCHEMA_VERSION = 4
+
+TASK_FIELDS = ('name', 'notes', 'minutes', 'timestamp')
+# rows per INSERT, kept under sqlite's default limit of 999 bound variables
+INSERT_BATCH = 100
+PAGE_SIZE = 10
+# archived years a connection reads in place at once, within sqlite's limit
+# of ten attached files and leaving room for merge()'s source
+ATTACH_LIMIT = 8
+CACHE_SIZE = 256
+ROW_TYPES = ('dicts', 'namedtuples', 'tuples')
+
+# pragmas applied by initialize(profile=...); cache_size is in KiB when negative
+PROFILES = {
+    "default": {},
+    "performance": {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "cache_size": -64 * 1024,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "memory",
+    },
+}
+
+TOTAL_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS daily_total_insert AFTER INSERT ON task BEGIN
+        INSERT INTO daily_total (name, day, minutes, tasks) 
+        VALUES (new.name, new.timestamp, new.minutes, 1)
+        ON CONFLICT (name, day) DO UPDATE 
+        SET minutes = minutes + excluded.minutes, tasks = tasks + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS daily_total_delete AFTER DELETE ON task BEGIN
+        UPDATE daily_total SET minutes = minutes - old.minutes, tasks = tasks - 1
+        WHERE name = old.name AND day = old.timestamp;
+        DELETE FROM daily_total WHERE name = old.name AND day = old.timestamp AND tasks = 0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS daily_total_update AFTER UPDATE ON task BEGIN
+        UPDATE daily_total SET minutes = minutes - old.minutes, tasks = tasks - 1
+        WHERE name = old.name AND day = old.timestamp;
+        DELETE FROM daily_total WHERE name = old.name AND day = old.timestamp AND tasks = 0;
+        INSERT INTO daily_total (name, day, minutes, tasks) 
+        VALUES (new.name, new.timestamp, new.minutes, 1)
+        ON CONFLICT (name, day) DO UPDATE 
+        SET minutes = minutes + excluded.minutes, tasks = tasks + 1;
+    END""",
+]
+
+EMPLOYEE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS employee_insert AFTER INSERT ON task BEGIN
+        INSERT OR IGNORE INTO employee (name) VALUES (new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS employee_update AFTER UPDATE OF name ON task BEGIN
+        INSERT OR IGNORE INTO employee (name) VALUES (new.name);
+    END""",
+]
+
+# set by initialize() once it knows whether sqlite was built with FTS5
+FTS_ENABLED = False
+
+FTS_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS task_fts_insert AFTER INSERT ON task BEGIN
+        INSERT INTO task_fts (rowid, name, notes) VALUES (new.id, new.name, new.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_fts_delete AFTER DELETE ON task BEGIN
+        INSERT INTO task_fts (task_fts, rowid, name, notes) 
+        VALUES ('delete', old.id, old.name, old.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS task_fts_update AFTER UPDATE ON task BEGIN
+        INSERT INTO task_fts (task_fts, rowid, name, notes) 
+        VALUES ('delete', old.id, old.name, old.notes);
+        INSERT INTO task_fts (rowid, name, notes) VALUES (new.id, new.name, new.notes);
+    END""",
+]
+
 
 class Task(Model):
     name = CharField(max_length=255)
     notes = TextField()
-    duration = TimeField()
-    timestamp = DateField(default=datetime.datetime.now)
+    minutes = IntegerField(index=True)
+    timestamp = DateField(default=datetime.datetime.now, index=True)
+
+    class Meta:
+        database = db
+        # (name, timestamp) also serves lookups and group_bys on name alone
+        indexes = (
+            (('name', 'timestamp'), False),
+        )
+
+
+class TaskIndex(FTS5Model):
+    """external content full-text index over Task.name and Task.notes"""
+    rowid = RowIDField()
+    name = SearchField()
+    notes = SearchField()
+
+    class Meta:
+        database = db
+        table_name = 'task_fts'
+        options = {'content': Task, 'content_rowid': Task.id}
+
+
+class DailyTotal(Model):
+    """minutes and task counts per employee per day, kept current by triggers"""
+    name = CharField(max_length=255)
+    day = DateField()
+    minutes = IntegerField(default=0)
+    tasks = IntegerField(default=0)
+
+    class Meta:
+        database = db
+        table_name = 'daily_total'
+        indexes = (
+            (('name', 'day'), True),
+            (('day', 'name'), False),
+        )
+
+
+class Employee(Model):
+    """every name a task has been logged under, registered by trigger"""
+    name = CharField(max_length=255, unique=True)
+
+    class Meta:
+        database = db
+
+
+class Archive(Model):
+    """a year of tasks moved by archive() into a file of its own"""
+    year = IntegerField(primary_key=True)
+    path = CharField()
+    tasks = IntegerField(default=0)
+
+    class Meta:
+        database = db
+
+
+class TaskDigest(Model):
+    """a hash of each task's content, live or archived, by task id, for
+    merge() to skip tasks the database already has"""
+    task = IntegerField(primary_key=True)
+    digest = CharField(max_length=32, index=True)
+
+    class Meta:
+        database = db
+        table_name = 'task_digest'
+
+
+class MergeProgress(Model):
+    """the last id merge() read from each source file, so that an
+    interrupted merge resumes there"""
+    source = CharField(primary_key=True)
+    last_id = IntegerField(default=0)
+    merged = IntegerField(default=0)
+    skipped = IntegerField(default=0)
 
     class Meta:
         database = db
+        table_name = 'merge_progress'
+
+
+class EmployeeIndex:
+    """sorted in-memory index of employee names, for prefix lookups on the
+    start of any word of a name"""
+
+    def __init__(self):
+        self.names = None
+        self.keys = []
+        self.lock = threading.Lock()
+
+    def load(self, names):
+        names = sorted(set(names))
+        keys = sorted((name[start:], name) for name in names for start in self.word_starts(name))
+        with self.lock:
+            self.names, self.keys = names, keys
+
+    def clear(self):
+        with self.lock:
+            self.names = None
+            self.keys = []
+
+    @staticmethod
+    def word_starts(name):
+        return [match.start() for match in re.finditer(r'\b\w', name)] or [0]
+
+    def add(self, name):
+        """registers a name logged since the index was loaded"""
+        with self.lock:
+            if self.names is None:
+                return
+            position = bisect.bisect_left(self.names, name)
+            if position < len(self.names) and self.names[position] == name:
+                return
+            self.names.insert(position, name)
+            for start in self.word_starts(name):
+                bisect.insort(self.keys, (name[start:], name))
+
+    def starting(self, prefix, limit=None):
+        """returns sorted names with a word starting with prefix"""
+        with self.lock:
+            if not prefix:
+                return self.names[:limit]
+            matches = set()
+            for key, name in islice(self.keys, bisect.bisect_left(self.keys, (prefix,)), None):
+                if not key.startswith(prefix):
+                    break
+                matches.add(name)
+        return sorted(matches)[:limit]
+
+    def count(self, prefix, limit=None):
+        """counts names with a word starting with prefix, stopping once limit
+        distinct names are seen"""
+        with self.lock:
+            if not prefix:
+                return len(self.names[:limit])
+            matches = set()
+            for key, name in islice(self.keys, bisect.bisect_left(self.keys, (prefix,)), None):
+                if not key.startswith(prefix) or len(matches) == limit:
+                    break
+                matches.add(name)
+        return len(matches)
+
+employee_index = EmployeeIndex()
+
+
+class QueryCache:
+    """least recently used store of query results, tagged with the task table
+    generation they were read at so that any write makes them stale"""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
 
+    def bump(self):
+        """marks every cached result stale after a write"""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
 
-def initialize(database=None):
+    def get(self, key, load):
+        """returns the cached result for key, calling load() on a miss"""
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+            generation = self.generation
+        result = load()
+        with self.lock:
+            # a write that landed while loading means result may already be stale
+            if generation == self.generation:
+                self.entries[key] = result
+                if len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return result
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "generation": self.generation,
+        }
+
+query_cache = QueryCache()
+
+# the connection each thread last read PRAGMA data_version on, and its value
+seen_writes = threading.local()
+
+def notice_other_writers():
+    """marks cached results and the employee index stale when another
+    connection, such as another
+    operator's process on the same file, committed since the calling
+    thread's connection last looked
+
+    PRAGMA data_version changes only for other connections' commits, and
+    costs no disk read. A connection not seen before may follow any number
+    of them.
+    """
+    connection = Task._meta.database.connection()
+    version = connection.execute("PRAGMA data_version").fetchone()[0]
+    if getattr(seen_writes, 'connection', None) is connection and seen_writes.version == version:
+        return
+    seen_writes.connection, seen_writes.version = connection, version
+    query_cache.bump()
+    employee_index.clear()
+
+
+def initialize(database=None, profile="default", **pragmas):
+    """connects, applies the named pragma profile plus any pragma overrides
+    such as cache_size or mmap_size, and creates the schema unless the file
+    is already marked with the current SCHEMA_VERSION"""
     if not database:
         database = db
-        database.connect()
+        database.connect(reuse_if_open=True)
     else:
-        database.connect()
-        database.bind([Task])
-    database.create_tables([Task], safe=True)
-    return db
+        database.connect(reuse_if_open=True)
+        database.bind([Task, TaskIndex, DailyTotal, Employee, Archive, TaskDigest, MergeProgress])
+    for key, value in dict(PROFILES[profile], **pragmas).items():
+        # permanent so connections opened later by other threads get it too
+        database.pragma(key, value, permanent=True)
+    if database.pragma('user_version') == SCHEMA_VERSION:
+        global FTS_ENABLED
+        FTS_ENABLED = TaskIndex.fts5_installed() and TaskIndex.table_exists()
+    else:
+        migrate_minutes(database)
+        # safe=True issues CREATE ... IF NOT EXISTS for the table and its
+        # indexes, so databases created before the indexes existed get them here
+        database.create_tables([Task, Archive, TaskDigest, MergeProgress], safe=True)
+        initialize_search(database)
+        initialize_totals(database)
+        initialize_employees(database)
+        database.pragma('user_version', SCHEMA_VERSION)
+    employee_index.clear()
+    partitions.clear()
+    query_cache.bump()
+    return database
+
+def migrate_minutes(database):
+    """converts task tables, archived years included, and the daily totals
+    from whole hours in a TIME duration column to an INTEGER minutes one"""
+    migrate_task_minutes(database, Task)
+    if Archive.table_exists():
+        paths = {archive.year: archive.path for archive in Archive.select()
+                 if os.path.exists(archive.path)}
+        # one file attached at a time, each outside the transaction converting it
+        for _, model in partitions.each(sorted(paths), paths):
+            migrate_task_minutes(database, model)
+    if 'hours' in [column.name for column in database.get_columns('daily_total')]:
+        with database.atomic():
+            database.execute_sql('ALTER TABLE daily_total RENAME COLUMN hours TO minutes')
+            database.execute_sql('UPDATE daily_total SET minutes = minutes * 60')
+    partitions.clear()
+
+def migrate_task_minutes(database, model):
+    """converts one task table, live or archived, to minutes"""
+    schema = model._meta.schema or 'main'
+    if 'duration' not in [column.name for column in database.get_columns('task', schema)]:
+        return
+    with database.atomic():
+        # the triggers name the old column; initialize() puts them back
+        for trigger, in database.execute_sql(
+                "SELECT name FROM {}.sqlite_master WHERE type = 'trigger' AND tbl_name = 'task'"
+                .format(schema)).fetchall():
+            database.execute_sql('DROP TRIGGER {}."{}"'.format(schema, trigger))
+        database.execute_sql('ALTER TABLE {}.task RENAME TO task_hours'.format(schema))
+        model._schema.create_table()
+        columns = ", ".join(['id'] + list(TASK_FIELDS))
+        database.execute_sql(
+            "INSERT INTO {0}.task ({1}) SELECT id, name, notes, duration * 60, timestamp "
+            "FROM {0}.task_hours".format(schema, columns))
+        database.execute_sql('DROP TABLE {}.task_hours'.format(schema))
+        model._schema.create_indexes()
+
+def initialize_search(database):
+    """creates the full-text index and its sync triggers if FTS5 is available"""
+    global FTS_ENABLED
+    FTS_ENABLED = TaskIndex.fts5_installed()
+    if not FTS_ENABLED:
+        return
+    with database.atomic():
+        is_new = not TaskIndex.table_exists()
+        TaskIndex.create_table(safe=True)
+        for trigger in FTS_TRIGGERS:
+            database.execute_sql(trigger)
+        if is_new:
+            # index whatever the task table held before search existed
+            TaskIndex.rebuild()
+
+def initialize_totals(database):
+    """creates the daily totals table and the triggers that maintain it"""
+    with database.atomic():
+        is_new = not DailyTotal.table_exists()
+        DailyTotal.create_table(safe=True)
+        for trigger in TOTAL_TRIGGERS:
+            database.execute_sql(trigger)
+        if is_new:
+            # total up whatever the task table held before the totals existed
+            DailyTotal.insert_from(
+                Task.select(Task.name, Task.timestamp, fn.SUM(Task.minutes), fn.COUNT(Task.id))
+                    .group_by(Task.name, Task.timestamp),
+                [DailyTotal.name, DailyTotal.day, DailyTotal.minutes, DailyTotal.tasks]
+            ).execute()
+
+def initialize_employees(database):
+    """creates the employee table and its trigger"""
+    with database.atomic():
+        is_new = not Employee.table_exists()
+        Employee.create_table(safe=True)
+        for trigger in EMPLOYEE_TRIGGERS:
+            database.execute_sql(trigger)
+        if is_new:
+            Employee.insert_from(
+                Task.select(Task.name).group_by(Task.name), [Employee.name]
+            ).on_conflict_ignore().execute()
+
+def attached_schemas(database):
+    """returns the names of the files attached to the calling thread's
+    connection, main and temp included"""
+    return {row[1] for row in database.execute_sql('PRAGMA database_list').fetchall()}
+
+
+class Partitions:
+    """the archived years of the bound database and the models that read
+    them, loaded from the archive table on first use
+
+    sqlite attaches at most ten files to a connection, so years are attached
+    only while in use, a few at a time.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.paths = None
+        self.tasks = None
+        self.models = {}
+
+    def load(self):
+        if self.paths is None:
+            archives = list(Archive.select())
+            self.paths = {archive.year: archive.path for archive in archives}
+            self.tasks = {archive.year: archive.tasks for archive in archives}
+
+    def years(self, start=None, end=None):
+        """returns the archived years overlapping start to end, either of
+        which may be None for an open end"""
+        self.load()
+        return sorted(year for year in self.paths
+                      if (not start or year >= start.year) and (not end or year <= end.year))
+
+    def model(self, year):
+        """returns a Task model for the year's file, which reads it while the
+        file is attached"""
+        if year not in self.models:
+            schema = "archive_{}".format(year)
+            self.models[year] = type("Task{}".format(year), (Task,), {
+                'Meta': type('Meta', (), {'schema': schema, 'table_name': 'task'}),
+                '__module__': __name__,
+            })
+        return self.models[year]
+
+    @contextmanager
+    def attached(self, years, paths=None):
+        """attaches the files of up to ATTACH_LIMIT years to the calling
+        thread's connection for the block, then detaches those it attached;
+        yields the years' models
+
+        sqlite refuses ATTACH and DETACH inside a transaction, so the block
+        must start and end outside one.
+        """
+        database = Task._meta.database
+        present = attached_schemas(database)
+        added = []
+        try:
+            for year in years:
+                schema = self.model(year)._meta.schema
+                if schema not in present:
+                    path = paths[year] if paths else self.paths[year]
+                    database.execute_sql('ATTACH DATABASE ? AS "{}"'.format(schema), (path,))
+                    added.append(schema)
+            yield [self.model(year) for year in years]
+        finally:
+            for schema in added:
+                database.execute_sql('DETACH DATABASE "{}"'.format(schema))
+
+    def each(self, years, paths=None):
+        """yields (year, model) for each year with its file attached in turn"""
+        for year in years:
+            with self.attached([year], paths) as (model,):
+                yield year, model
+
+    def span(self, start=None, end=None):
+        """returns a model over the live tasks and every archived year
+        overlapping start to end, joined by a temporary UNION ALL view; just
+        Task when no archive overlaps
+
+        Up to ATTACH_LIMIT years are read in place, attached until another
+        span needs the room. More years than that are copied into a
+        temporary table one at a time. Attachments and temporary tables
+        belong to one connection, so both are checked on the calling
+        thread's connection every time, as it may be new or another thread's.
+        """
+        years = self.years(start, end)
+        if not years:
+            return Task
+        database = Task._meta.database
+        schemas = [self.model(year)._meta.schema for year in years]
+        columns = ", ".join(['id'] + list(TASK_FIELDS))
+        if len(years) <= ATTACH_LIMIT and self.make_room(database, schemas):
+            present = attached_schemas(database)
+            for year, schema in zip(years, schemas):
+                if schema not in present:
+                    database.execute_sql('ATTACH DATABASE ? AS "{}"'.format(schema), (self.paths[year],))
+            name = "task_" + "_".join(map(str, years))
+            sources = ["{}.task".format(schema) for schema in schemas]
+        else:
+            self.copy(database, years)
+            # the copy may hold other years too, but every span of fewer
+            # than all the years is read with dates that leave those out
+            name, sources = "task_copied", ["temp.task_archived"]
+        database.execute_sql(
+            "CREATE TEMP VIEW IF NOT EXISTS {} AS ".format(name) +
+            " UNION ALL ".join(["SELECT {} FROM {}".format(columns, source)
+                                for source in ["main.task"] + sources]))
+        if name not in self.models:
+            self.models[name] = type("TaskSpan", (Task,), {
+                'Meta': type('Meta', (), {'table_name': name}),
+                '__module__': __name__,
+            })
+        return self.models[name]
+
+    def make_room(self, database, schemas):
+        """detaches the archived years not among schemas until those missing
+        fit within ATTACH_LIMIT; False when years still being read are in
+        the way"""
+        present = {schema for schema in attached_schemas(database) if schema.startswith("archive_")}
+        spare = sorted(present - set(schemas))
+        while len(present | set(schemas)) > ATTACH_LIMIT and spare:
+            schema = spare.pop()
+            try:
+                database.execute_sql('DETACH DATABASE "{}"'.format(schema))
+                present.discard(schema)
+            except OperationalError:
+                # an unfinished cursor still reads it
+                pass
+        return len(present | set(schemas)) <= ATTACH_LIMIT
+
+    def copy(self, database, years):
+        """brings the connection's temporary copy of the years up to date with
+        the archive table, attaching one year's file at a time"""
+        database.execute_sql(
+            "CREATE TEMP TABLE IF NOT EXISTS task_archived (id INTEGER NOT NULL PRIMARY KEY, "
+            "name VARCHAR(255) NOT NULL, notes TEXT NOT NULL, minutes INTEGER NOT NULL, "
+            "timestamp DATE NOT NULL)")
+        database.execute_sql(
+            "CREATE INDEX IF NOT EXISTS temp.task_archived_name_timestamp ON task_archived (name, timestamp)")
+        database.execute_sql(
+            "CREATE TEMP TABLE IF NOT EXISTS archive_copied (year INTEGER PRIMARY KEY, tasks INTEGER)")
+        copied = dict(database.execute_sql("SELECT year, tasks FROM temp.archive_copied").fetchall())
+        columns = ", ".join(['id'] + list(TASK_FIELDS))
+        stale = [year for year in years if copied.get(year) != self.tasks[year]]
+        for year, model in self.each(stale):
+            with database.atomic():
+                database.execute_sql("DELETE FROM temp.task_archived WHERE timestamp BETWEEN ? AND ?",
+                                     (str(datetime.date(year, 1, 1)), str(datetime.date(year, 12, 31))))
+                database.execute_sql("INSERT INTO temp.task_archived ({0}) SELECT {0} FROM {1}.task"
+                                     .format(columns, model._meta.schema))
+                database.execute_sql("INSERT OR REPLACE INTO temp.archive_copied VALUES (?, ?)",
+                                     (year, self.tasks[year]))
+
+partitions = Partitions()
+
+def archive_path(database, year, directory=None):
+    """names the year's archive after the live file, e.g. work_log_2019.db"""
+    if database.database == ':memory:' and not directory:
+        raise ValueError("an in-memory database needs an archive directory")
+    stem, extension = os.path.splitext(os.path.basename(database.database))
+    directory = directory or os.path.dirname(os.path.abspath(database.database))
+    return os.path.join(directory, "{}_{}{}".format(stem, year, extension or ".db"))
+
+def archive(before, directory=None):
+    """moves tasks dated before the given day into one file per year
+
+    The daily totals of the moved days are kept, so reports and the date
+    picker still cover archived years. The task with the highest id always
+    stays live, since sqlite hands out new ids above the largest one left in
+    the table and ids must stay unique across the partitions. Returns the
+    number of tasks moved per year.
+    """
+    database = Task._meta.database
+    newest = Task.select(fn.MAX(Task.id)).scalar()
+    moving = (Task.timestamp < before) & (Task.id != newest)
+    years = sorted({day.year for day, in Task.select(Task.timestamp).where(moving)
+                                               .distinct().tuples()})
+    # a year archived before keeps its file
+    archived = partitions.years()
+    paths = {year: partitions.paths[year] if year in archived else archive_path(database, year, directory)
+             for year in years}
+    fields = [Task.id] + [getattr(Task, field) for field in TASK_FIELDS]
+    moved = {}
+    # only so many files attach at once, and never inside a transaction, so
+    # the years move a group at a time, each group committed on its own
+    for first in range(0, len(years), ATTACH_LIMIT):
+        group = years[first:first + ATTACH_LIMIT]
+        with partitions.attached(group, paths) as models:
+            for model in models:
+                model.create_table(safe=True)
+            with database.atomic():
+                days = (DailyTotal.day < before) & DailyTotal.day.between(
+                    datetime.date(group[0], 1, 1), datetime.date(group[-1], 12, 31))
+                totals = list(DailyTotal.select().where(days).dicts())
+                for year, model in zip(group, models):
+                    rows = moving & Task.timestamp.between(datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+                    model.insert_from(Task.select(*fields).where(rows), fields).execute()
+                    moved[year] = Task.delete().where(rows).execute()
+                    Archive.insert(year=year, path=paths[year],
+                                   tasks=model.select().count()).on_conflict_replace().execute()
+                # the delete triggers took the moved tasks out of the totals; put them back
+                for start in range(0, len(totals), INSERT_BATCH):
+                    DailyTotal.insert_many(totals[start:start + INSERT_BATCH]).on_conflict_replace().execute()
+    partitions.clear()
+    query_cache.bump()
+    return moved
+
+def database_size(database):
+    """returns the bytes a database file and its write-ahead log take on disk"""
+    paths = [database.database, database.database + '-wal']
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+def maintain():
+    """rebuilds the live file without free pages, checkpoints the WAL into
+    it and refreshes the planner statistics; returns the size before and after"""
+    database = Task._meta.database
+    before = database_size(database)
+    database.execute_sql('VACUUM')
+    if database.pragma('journal_mode') == 'wal':
+        database.execute_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+    database.execute_sql('ANALYZE')
+    return before, database_size(database)
+
+def task_digest(name, notes, minutes, timestamp):
+    """returns a hash of a task's content, the same for a copy of the task
+    in any database
+
+    >>> task_digest("nic", "notes", 30, datetime.date(2019, 1, 1))
+    'd8f312820189e856265bf002737fc788'
+    >>> task_digest("nic", "notes", 30, "2019-01-01 09:30:00")
+    'd8f312820189e856265bf002737fc788'
+    """
+    content = "\x1f".join([name, notes, str(minutes), str(timestamp)[:10]])
+    return blake2b(content.encode(), digest_size=16).hexdigest()
+
+def id_batches(query, size, after=0):
+    """yields lists of up to size tuple rows of query, whose first column is
+    the id, in id order; each batch is one range scan on the primary key
+    starting after the last id of the one before"""
+    model = query.model
+    while True:
+        rows = list(query.where(model.id > after).order_by(model.id).limit(size).tuples())
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][0]
+
+def known_digests(digests):
+    """returns those of digests some task already has"""
+    digests = list(digests)
+    known = set()
+    for start in range(0, len(digests), INSERT_BATCH):
+        known.update(digest for digest, in TaskDigest.select(TaskDigest.digest)
+                     .where(TaskDigest.digest.in_(digests[start:start + INSERT_BATCH])).tuples())
+    return known
+
+def hash_tasks(batch_size=5000):
+    """records the digests of tasks logged since the last merge, archived
+    years included; returns how many were hashed"""
+    database = Task._meta.database
+    last = TaskDigest.select(fn.MAX(TaskDigest.task)).scalar() or 0
+    fields = [Task.id] + [getattr(Task, field) for field in TASK_FIELDS]
+    # ids are unique across the partitions, so one watermark covers them all
+    years = [year for year in partitions.years() if os.path.exists(partitions.paths[year])]
+    def hash_model(model):
+        hashed = 0
+        columns = [getattr(model, field.name) for field in fields]
+        for rows in id_batches(model.select(*columns), batch_size, after=last):
+            digests = [{'task': row[0], 'digest': task_digest(*row[1:])} for row in rows]
+            with database.atomic():
+                for start in range(0, len(digests), INSERT_BATCH):
+                    TaskDigest.insert_many(digests[start:start + INSERT_BATCH]).on_conflict_ignore().execute()
+            hashed += len(rows)
+        return hashed
+    hashed = hash_model(Task)
+    for _, model in partitions.each(years):
+        hashed += hash_model(model)
+    return hashed
+
+def merge_source(path):
+    """returns a Task model over the task table of the file at path,
+    attached as merge_source; files from before minutes were stored give
+    their whole hours as minutes"""
+    database = Task._meta.database
+    database.attach(path, 'merge_source')
+    model = type("MergeSource", (Task,), {
+        'Meta': type('Meta', (), {'schema': 'merge_source', 'table_name': 'task'}),
+        '__module__': __name__,
+    })
+    columns = [column.name for column in database.get_columns('task', 'merge_source')]
+    if not columns:
+        database.detach('merge_source')
+        raise ValueError("{} has no tasks".format(path))
+    minutes = model.minutes if 'minutes' in columns else SQL('duration * 60')
+    return model, [model.id, model.name, model.notes, minutes, model.timestamp]
+
+def merge(paths, batch_size=5000):
+    """copies the tasks of every database file in paths that this one does
+    not already have, under new ids
+
+    Tasks are read batch_size at a time in id order and compared by
+    task_digest() with every task here, archived or not, and with those
+    merged before them. Each batch commits with the id it read up to, so an
+    interrupted merge picks up where it stopped when run again, as does a
+    later merge of the same file. Archived years of a source are files of
+    their own and are merged by passing them too. Returns the number of
+    tasks merged and skipped per path.
+    """
+    database = Task._meta.database
+    target = os.path.abspath(database.database)
+    results = OrderedDict()
+    hash_tasks(batch_size)
+    fields = [Task.id] + [getattr(Task, field) for field in TASK_FIELDS]
+    for path in paths:
+        source = os.path.abspath(path)
+        if source == target:
+            raise ValueError("{} is the database being merged into".format(path))
+        if not os.path.exists(source):
+            raise ValueError("{} does not exist".format(path))
+        progress, _ = MergeProgress.get_or_create(source=source)
+        merged = skipped = 0
+        # ATTACH is refused inside a transaction, so the source is attached first
+        model, columns = merge_source(source)
+        try:
+            for rows in id_batches(model.select(*columns), batch_size, after=progress.last_id):
+                fresh = OrderedDict()
+                for row in rows:
+                    fresh.setdefault(task_digest(*row[1:]), row)
+                # IMMEDIATE takes the write lock before the reads, so no other
+                # writer can add these digests or take these ids in between
+                with database.atomic(lock_type='IMMEDIATE'):
+                    for digest in known_digests(fresh):
+                        del fresh[digest]
+                    next_id = (Task.select(fn.MAX(Task.id)).scalar() or 0) + 1
+                    tasks = [(next_id + number,) + row[1:] for number, row in enumerate(fresh.values())]
+                    digests = [(task[0], digest) for task, digest in zip(tasks, fresh)]
+                    for start in range(0, len(tasks), INSERT_BATCH):
+                        Task.insert_many(tasks[start:start + INSERT_BATCH], fields).execute()
+                        TaskDigest.insert_many(digests[start:start + INSERT_BATCH],
+                                               [TaskDigest.task, TaskDigest.digest]).execute()
+                    progress.last_id = rows[-1][0]
+                    progress.merged += len(tasks)
+                    progress.skipped += len(rows) - len(tasks)
+                    progress.save()
+                merged += len(tasks)
+                skipped += len(rows) - len(tasks)
+        finally:
+            database.detach('merge_source')
+        results[path] = (merged, skipped)
+    query_cache.bump()
+    employee_index.clear()
+    return results
+
+def search_terms(phrase):
+    """turns user input into an FTS5 query of prefix terms that must all match
+    
+    >>> search_terms('these notes')
+    '"these"* "notes"*'
+    """
+    return " ".join('"{}"*'.format(term) for term in re.findall(r'\w+', phrase))
+
+def explain(query):
+    """returns the sqlite query plan details for a peewee query"""
+    sql, params = query.sql()
+    cursor = Task._meta.database.execute_sql('EXPLAIN QUERY PLAN ' + sql, params)
+    return [row[-1] for row in cursor.fetchall()]
+
+def with_minutes(row):
+    """returns the row with a duration in whole hours, as tasks were once
+    logged, given as minutes instead"""
+    if 'duration' not in row:
+        return row
+    row = dict(row)
+    try:
+        row.setdefault('minutes', int(row['duration']) * 60)
+    except (TypeError, ValueError):
+        raise ValueError("duration must be a whole number of hours")
+    del row['duration']
+    return row
 
 def CREATE_TASK(data):
-    Task.create(**data)
+    Task.create(**with_minutes(data))
+    query_cache.bump()
+    employee_index.add(data['name'])
+
+def clean_task(row):
+    """returns a task dict ready for insert_many, or raises ValueError"""
+    row = with_minutes(row)
+    # exports carry each task's id, which insert reassigns, so it is dropped
+    unknown = set(row) - set(TASK_FIELDS) - {'id'}
+    if unknown:
+        raise ValueError("unknown fields: {}".format(", ".join(sorted(unknown))))
+    name = (row.get('name') or "").strip().lower()
+    if not name or len(name) > Task.name.max_length:
+        raise ValueError("name must be 1 to {} characters".format(Task.name.max_length))
+    try:
+        minutes = int(row.get('minutes'))
+    except (TypeError, ValueError):
+        raise ValueError("minutes must be a whole number")
+    timestamp = row.get('timestamp') or datetime.date.today()
+    if isinstance(timestamp, str):
+        timestamp = datetime.date.fromisoformat(timestamp.strip()[:10])
+    return {
+        'name': name,
+        'notes': (row.get('notes') or "").strip().lower(),
+        'minutes': minutes,
+        'timestamp': timestamp,
+    }
+
+def CREATE_TASKS(rows, batch_size=5000):
+    """inserts an iterable of task dicts, committing every batch_size rows
+
+    Each batch is validated in full before any of it is written, so a bad row
+    leaves the earlier batches committed and nothing of its own batch.
+    Returns the number of tasks created.
+    """
+    rows = iter(rows)
+    created = 0
+    while True:
+        batch = []
+        for row in islice(rows, batch_size):
+            try:
+                batch.append(clean_task(row))
+            except ValueError as err:
+                raise ValueError("row {}: {} ({} rows imported)".format(
+                    created + len(batch) + 1, err, created))
+        if not batch:
+            return created
+        with Task._meta.database.atomic():
+            for start in range(0, len(batch), INSERT_BATCH):
+                Task.insert_many(batch[start:start + INSERT_BATCH]).execute()
+        query_cache.bump()
+        for name in {row['name'] for row in batch}:
+            employee_index.add(name)
+        created += len(batch)
+
+def row_id(row):
+    """returns the task id of a dict, namedtuple or tuple row"""
+    if isinstance(row, dict):
+        return row['id']
+    return row.id if hasattr(row, '_fields') else row[0]
+
+def keyset_pages(query, size=PAGE_SIZE):
+    """returns a pages(cursor) function that walks query in id order
+
+    pages() returns (rows, previous_cursor, next_cursor), either cursor being
+    None at the ends. Each page is one indexed range scan on the primary key,
+    however deep into the results it is.
+    """
+    model = query.model
+    def pages(cursor=None):
+        direction, key = cursor or ('after', 0)
+        if direction == 'after':
+            rows = list(query.where(model.id > key).order_by(model.id).limit(size + 1))
+            has_previous, has_next = key > 0, len(rows) > size
+            rows = rows[:size]
+        else:
+            rows = list(query.where(model.id < key).order_by(model.id.desc()).limit(size + 1))
+            has_previous, has_next = len(rows) > size, True
+            rows = rows[:size][::-1]
+        if not rows:
+            return rows, None, None
+        return (
+            rows,
+            ('before', row_id(rows[0])) if has_previous else None,
+            ('after', row_id(rows[-1])) if has_next else None,
+        )
+    return pages
+
+def offset_pages(query, size=PAGE_SIZE):
+    """returns a pages(cursor) function like keyset_pages that keeps the
+    query's own ordering, for results such as ranked searches that are not
+    in id order"""
+    def pages(cursor=None):
+        offset = cursor or 0
+        rows = list(query.limit(size + 1).offset(offset))
+        return (
+            rows[:size],
+            max(offset - size, 0) if offset else None,
+            offset + size if len(rows) > size else None,
+        )
+    return pages
+
+def count_rows(query, limit=None):
+    """counts a query's rows in SQL without fetching them, stopping at limit
+    when one is given"""
+    if limit is not None:
+        query = query.limit(limit)
+    return query.order_by().count()
 
 def to_dictionary(func):
+    """returns the helper's query yielding dicts, or with row_type='namedtuples'
+    or 'tuples' the leaner rows that large result sets want"""
     @wraps(func)
-    def inner(*args, **kwargs):
-        return func(*args, **kwargs).dicts()
+    def inner(*args, row_type='dicts', **kwargs):
+        if row_type not in ROW_TYPES:
+            raise ValueError("row_type must be one of {}".format(", ".join(ROW_TYPES)))
+        return getattr(func(*args, **kwargs), row_type)()
+    return inner
+
+def cached(func):
+    """memoizes a helper's rows in query_cache, keyed on its name and arguments
+
+    Only for helpers with small results, since the rows are read up front.
+    Each call gets its own list, but the rows are shared. Commits from other
+    connections are noticed before each lookup. A to_dictionary
+    helper's row_type is part of the key. The query itself stays reachable
+    as helper.uncached.
+    """
+    @wraps(func)
+    def inner(*args, row_type='dicts'):
+        notice_other_writers()
+        return list(query_cache.get((func.__name__, row_type) + args,
+                                    lambda: list(func(*args, row_type=row_type))))
+    inner.uncached = func
     return inner
 
 @to_dictionary
 def ALL_TASKS():
     return Task.select()
 
+@cached
 @to_dictionary
 def ALL_NAMES():
     return Task.select(Task.name).group_by(Task.name)
 
+@cached
 @to_dictionary
 def NAMES_MATCHING(name):
     return Task.select(Task.name).where(Task.name.contains(name)).group_by(Task.name)
 
+def NAMES_STARTING(prefix, limit=None):
+    """returns name dicts like NAMES_MATCHING for names with a word starting
+    with prefix, from the in-memory employee index"""
+    load_employee_index()
+    return [{'name': name} for name in employee_index.starting(prefix, limit)]
+
+def load_employee_index():
+    notice_other_writers()
+    if employee_index.names is None:
+        employee_index.load(name for name, in Employee.select(Employee.name).tuples())
+
+def COUNT_NAMES_STARTING(prefix, limit=None):
+    """counts the names NAMES_STARTING would return, up to limit"""
+    load_employee_index()
+    return employee_index.count(prefix, limit)
+
+def COUNT_NAMES_MATCHING(name, limit=None):
+    """counts the names NAMES_MATCHING would return in SQL, up to limit"""
+    return count_rows(NAMES_MATCHING.uncached(name), limit)
+
+def NAME_EXISTS(name):
+    return Employee.select().where(Employee.name == name).exists()
+
+@cached
 @to_dictionary
 def ALL_DATES():
     return Task.select(Task.timestamp).group_by(Task.timestamp)
 
 @to_dictionary
-def TASKS_WITH_DURATION(time):
-    return Task.select().where(Task.duration == time)
+def TASKS_WITH_DURATION(minutes):
+    return Task.select().where(Task.minutes == minutes)
+
+def duration_range(query, shortest=None, longest=None, model=Task):
+    """narrows a task query to durations between shortest and longest
+    minutes, inclusive"""
+    if shortest is not None:
+        query = query.where(model.minutes >= shortest)
+    if longest is not None:
+        query = query.where(model.minutes <= longest)
+    return query
+
+@to_dictionary
+def TASKS_LASTING(shortest=None, longest=None):
+    """tasks taking from shortest to longest minutes, either end open"""
+    return duration_range(Task.select(), shortest, longest)
 
 @to_dictionary
 def TASK_WITH_ID(ID):
@@ -68,8 +1007,102 @@ def TASKS_WITH_NAME(name):
 
 @to_dictionary
 def TASKS_WITH_DATE(date):
-    return Task.select().where(Task.timestamp == date)
+    model = partitions.span(date, date)
+    return model.select().where(model.timestamp == date)
+
+@to_dictionary
+def TASKS_IN_RANGE(start, end):
+    model = partitions.span(start, end)
+    return model.select().where(model.timestamp.between(start, end))
 
 @to_dictionary
 def TASKS_CONTAINING(phrase):
-    return Task.select().where(Task.name.contains(phrase) | Task.notes.contains(phrase))
+    terms = search_terms(phrase)
+    if not FTS_ENABLED or not terms:
+        return Task.select().where(Task.name.contains(phrase) | Task.notes.contains(phrase))
+    return (Task.select()
+            .join(TaskIndex, on=(Task.id == TaskIndex.rowid))
+            .where(TaskIndex.match(terms))
+            .order_by(TaskIndex.rank()))
+
+@to_dictionary
+def TASKS_MATCHING(name=None, phrase=None, start=None, end=None, duration=None, 
+                   shortest=None, longest=None, archived=False):
+    """tasks meeting every filter given, ranked for a phrase and in id order
+    otherwise
+
+    Durations are in minutes, duration matching exactly and shortest and
+    longest bounding a range. Archived years overlapping start to end are
+    read too, or all of them with archived=True. Phrases match archived
+    tasks unranked, as they have no full-text index.
+    """
+    model = partitions.span(start, end) if start or end or archived else Task
+    if phrase and model is Task:
+        query = TASKS_CONTAINING.__wrapped__(phrase)
+    else:
+        query = model.select().order_by(model.id)
+        if phrase:
+            query = query.where(model.name.contains(phrase) | model.notes.contains(phrase))
+    if name:
+        query = query.where(model.name == name)
+    if start:
+        query = query.where(model.timestamp >= start)
+    if end:
+        query = query.where(model.timestamp <= end)
+    if duration is not None:
+        query = query.where(model.minutes == duration)
+    return duration_range(query, shortest, longest, model)
+
+
+def day_range(query, start=None, end=None):
+    """narrows a DailyTotal query to days between start and end, inclusive"""
+    if start:
+        query = query.where(DailyTotal.day >= start)
+    if end:
+        query = query.where(DailyTotal.day <= end)
+    return query
+
+def total_columns(minutes, tasks):
+    """returns the minutes, hours, tasks and average minutes per task
+    columns of a totals query, all worked out by sqlite"""
+    return [
+        minutes.alias('minutes'),
+        fn.ROUND(minutes / 60.0, 2).alias('hours'),
+        tasks.alias('tasks'),
+        fn.ROUND(minutes * 1.0 / tasks, 1).alias('average'),
+    ]
+
+@to_dictionary
+def DAILY_TOTALS(start=None, end=None):
+    return (day_range(DailyTotal.select(DailyTotal.day, DailyTotal.name, 
+                                        *total_columns(DailyTotal.minutes, DailyTotal.tasks)), start, end)
+            .order_by(DailyTotal.day, DailyTotal.name))
+
+@to_dictionary
+def WEEKLY_TOTALS(start=None, end=None):
+    week = fn.strftime('%Y-%W', DailyTotal.day)
+    return (day_range(DailyTotal.select(week.alias('week'), DailyTotal.name, 
+                                        *total_columns(fn.SUM(DailyTotal.minutes), 
+                                                       fn.SUM(DailyTotal.tasks))), start, end)
+            .group_by(week, DailyTotal.name)
+            .order_by(week, DailyTotal.name))
+
+@to_dictionary
+def EMPLOYEE_TOTALS(start=None, end=None):
+    return (day_range(DailyTotal.select(DailyTotal.name, 
+                                        *total_columns(fn.SUM(DailyTotal.minutes), 
+                                                       fn.SUM(DailyTotal.tasks))), start, end)
+            .group_by(DailyTotal.name)
+            .order_by(DailyTotal.name))
+
+@cached
+@to_dictionary
+def DAYS_WITH_TASKS(start, end):
+    return (day_range(DailyTotal.select(DailyTotal.day), start, end)
+            .group_by(DailyTotal.day)
+            .order_by(DailyTotal.day))
+
+def LATEST_DAY():
+    """returns the most recent day with a task, or None for an empty log"""
+    latest = DailyTotal.select(DailyTotal.day).order_by(DailyTotal.day.desc()).first()
+    return latest.day if latest else None
\ No newline at end of file
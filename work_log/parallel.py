@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Exports split into id ranges that worker processes query and format side
+by side, each over its own read-only connection, and written in id order.
+
+    write_parallel("work_log.db", {"archived": True}, write_csv, sys.stdout, workers=4)
+"""
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+from peewee import SqliteDatabase, fn
+
+from .models import (Task, TaskIndex, DailyTotal, Employee, Archive, partitions,
+                     TASKS_MATCHING)
+
+# id ranges per worker, so that one slow range leaves the others busy
+SHARDS_PER_WORKER = 4
+# formatted ranges held per worker while waiting for an earlier one
+AHEAD_PER_WORKER = 2
+
+
+def id_shards(query, count):
+    """returns up to count (low, high) id ranges, inclusive, of equal width
+    covering the ids of query's rows"""
+    model = query.model
+    low, high = query.select(fn.MIN(model.id), fn.MAX(model.id)).order_by().scalar(as_tuple=True)
+    if low is None:
+        return []
+    width = -(-(high - low + 1) // count)
+    return [(start, min(start + width - 1, high)) for start in range(low, high + 1, width)]
+
+def open_reader(path):
+    """binds the models to a read-only connection of the worker's own"""
+    database = SqliteDatabase("file:{}?mode=ro".format(quote(os.path.abspath(path))), uri=True)
+    database.connect()
+    database.bind([Task, TaskIndex, DailyTotal, Employee, Archive])
+    partitions.clear()
+
+def format_shard(filters, low, high, write, header):
+    """returns the tasks matching filters with ids from low to high as
+    formatted by write"""
+    query = TASKS_MATCHING(**filters)
+    out = io.StringIO()
+    write(query.where(query.model.id.between(low, high)), out, header=header)
+    return out.getvalue()
+
+def write_parallel(path, filters, write, out, workers):
+    """writes the tasks in the database file at path matching the
+    TASKS_MATCHING filters to out with write, in id order, formatting id
+    ranges in workers processes
+
+    Ranked phrase searches are not in id order, so they can't be split.
+    """
+    shards = id_shards(TASKS_MATCHING(**filters), workers * SHARDS_PER_WORKER)
+    if not shards:
+        write(TASKS_MATCHING(**filters), out)
+        return
+    with ProcessPoolExecutor(workers, initializer=open_reader, initargs=(path,)) as pool:
+        pending = deque()
+        try:
+            for number, (low, high) in enumerate(shards):
+                pending.append(pool.submit(format_shard, filters, low, high, write, number == 0))
+                if len(pending) >= workers * AHEAD_PER_WORKER:
+                    out.write(pending.popleft().result())
+            while pending:
+                out.write(pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
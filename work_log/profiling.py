@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Timings of every SQL statement and menu step, with a slow-query log.
+
+    profiler.enable(database, slow_ms=50, log_path="slow.log")
+    ...
+    print(profiler.summary())
+
+Statements are timed from execute until their last row is fetched. Only
+the standard library is imported up front so that the profiler costs
+nothing at startup while it is disabled.
+"""
+import sys
+import threading
+from inspect import isawaitable
+from time import perf_counter
+
+# statements slower than this are logged with their query plan
+SLOW_MS = 100
+# statements and steps listed by summary()
+SUMMARY_ROWS = 15
+
+
+class Stats:
+    """calls, rows and time totalled over every run of a statement or step"""
+
+    def __init__(self):
+        self.calls = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+
+    def add(self, seconds, rows=0):
+        self.calls += 1
+        self.rows += rows
+        self.seconds += seconds
+        self.slowest = max(self.slowest, seconds)
+
+
+class ProfiledCursor:
+    """wraps a sqlite cursor, timing and counting rows as they are fetched
+    and reporting once the cursor is used up, closed or dropped
+
+    A dropped cursor is reported by the garbage collector, on whatever
+    thread it runs and maybe after the connection closed, so no query plan
+    is looked up for it.
+    """
+
+    def __init__(self, cursor, seconds, finish):
+        self.cursor = cursor
+        self.seconds = seconds
+        self.rows = 0
+        self.finish = finish
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def timed(self, fetch, *args):
+        start = perf_counter()
+        result = fetch(*args)
+        self.seconds += perf_counter() - start
+        return result
+
+    def fetchone(self):
+        row = self.timed(self.cursor.fetchone)
+        if row is None:
+            self.done()
+        else:
+            self.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self.timed(self.cursor.fetchmany, *args)
+        self.rows += len(rows)
+        if not rows:
+            self.done()
+        return rows
+
+    def fetchall(self):
+        rows = self.timed(self.cursor.fetchall)
+        self.rows += len(rows)
+        self.done()
+        return rows
+
+    def close(self):
+        self.done()
+        self.cursor.close()
+
+    def done(self, explain=True):
+        if self.finish:
+            finish, self.finish = self.finish, None
+            finish(self.rows, self.seconds, explain)
+
+    def __del__(self):
+        self.done(explain=False)
+
+
+class Profiler:
+    """collects statement and step timings while enabled"""
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_ms = SLOW_MS
+        self.log = None
+        self.handler = None
+        self.databases = []
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.queries = {}
+            self.steps = {}
+
+    def enable(self, database, slow_ms=SLOW_MS, log_path=None):
+        """times every statement database runs, logging those slower than
+        slow_ms with their query plan to log_path, or stderr without one"""
+        import logging
+        self.log = logging.getLogger(__name__)
+        # enabling again replaces the log, so a new log_path takes effect
+        self.close_log()
+        self.handler = logging.FileHandler(log_path) if log_path else logging.StreamHandler()
+        self.handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.log.addHandler(self.handler)
+        self.log.setLevel(logging.WARNING)
+        self.slow_ms = slow_ms
+        if database not in self.databases:
+            self.install(database)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        for database in self.databases:
+            del database.execute_sql
+        self.databases = []
+        self.close_log()
+
+    def close_log(self):
+        if self.handler:
+            self.log.removeHandler(self.handler)
+            self.handler.close()
+            self.handler = None
+
+    def install(self, database):
+        execute_sql = database.execute_sql
+        def profiled_execute_sql(sql, params=None):
+            start = perf_counter()
+            cursor = execute_sql(sql, params)
+            seconds = perf_counter() - start
+            finish = lambda rows, seconds, explain=True: self.query(
+                execute_sql, sql, params, rows, seconds, explain)
+            if cursor.description is None:
+                finish(max(cursor.rowcount, 0), seconds)
+                return cursor
+            return ProfiledCursor(cursor, seconds, finish)
+        # an instance attribute, so only this database is timed
+        database.execute_sql = profiled_execute_sql
+        self.databases.append(database)
+
+    def query(self, execute_sql, sql, params, rows, seconds, explain=True):
+        """records one statement, logging it when it ran slowly, with its plan
+        unless explain is false"""
+        with self.lock:
+            self.queries.setdefault(sql, Stats()).add(seconds, rows)
+        if seconds * 1000 >= self.slow_ms and sql.lstrip().upper().startswith("SELECT"):
+            plan = ([row[-1] for row in execute_sql("EXPLAIN QUERY PLAN " + sql, params)]
+                    if explain else ["not looked up for a dropped cursor"])
+            self.log.warning("slow query %.1f ms, %d rows: %s %r\n  plan: %s",
+                             seconds * 1000, rows, sql, tuple(params or ()), " / ".join(plan))
+
+    def step(self, name, seconds):
+        with self.lock:
+            self.steps.setdefault(name, Stats()).add(seconds)
+
+    def summary(self):
+        """returns the statements and steps that took longest in total"""
+        lines = []
+        for title, stats in [("statements", self.queries), ("steps", self.steps)]:
+            if not stats:
+                continue
+            lines.append("{:>8} {:>10} {:>10} {:>10}  {}".format("calls", "rows", "total ms", "max ms", title))
+            ranked = sorted(stats.items(), key=lambda item: item[1].seconds, reverse=True)
+            for name, stat in ranked[:SUMMARY_ROWS]:
+                lines.append("{:>8} {:>10} {:>10.1f} {:>10.1f}  {}".format(
+                    stat.calls, stat.rows, stat.seconds * 1000, stat.slowest * 1000, name))
+        return "\n".join(lines)
+
+    def report(self, stream=None):
+        summary = self.summary()
+        if summary:
+            print(summary, file=stream or sys.stderr)
+
+profiler = Profiler()
+
+def step_name(func):
+    """names an exec_funcs step, looking through partials"""
+    func = getattr(func, 'func', func)
+    return getattr(func, '__name__', func.__class__.__name__)
+
+def timed_step(func, *args, **kwargs):
+    """calls an exec_funcs step, recording its wall time while profiling"""
+    if not profiler.enabled:
+        return func(*args, **kwargs)
+    start = perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.step(step_name(func), perf_counter() - start)
+
+async def timed_step_async(func, *args, **kwargs):
+    """timed_step for a step that may return an awaitable, which is awaited
+    and timed to the end"""
+    start = perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        if isawaitable(result):
+            result = await result
+        return result
+    finally:
+        if profiler.enabled:
+            profiler.step(step_name(func), perf_counter() - start)
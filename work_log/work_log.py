@@ -1,74 +1,187 @@
 #!/usr/bin/env python3
 
+import re
+import calendar
+import datetime
 from functools import partial
 from copy import copy
 
 from .menuize import (Menu, option, end, list_print, line_input, multiline_input, 
                     numerical_input, confirmed, clear_screen, choice_menu, pause,
-                    print_alert, exec_funcs)
+                    print_alert, exec_funcs, page_print, date_input, get_opt_name, draw, clear,
+                    answers, ask, ask_rest, text_input)
 
-from .models import (initialize, ALL_TASKS, ALL_NAMES, ALL_DATES, CREATE_TASK, 
-                    TASKS_WITH_DURATION, NAMES_MATCHING, TASK_WITH_ID, TASKS_WITH_NAME,
-                    TASKS_WITH_DATE, TASKS_CONTAINING)
+from .models import (initialize, ALL_NAMES, CREATE_TASK, CREATE_TASKS, clean_task,
+                    NAMES_STARTING, TASK_WITH_ID, TASKS_MATCHING,
+                    TASKS_IN_RANGE, keyset_pages, offset_pages,
+                    NAME_EXISTS, COUNT_NAMES_STARTING, count_rows,
+                    DAYS_WITH_TASKS, LATEST_DAY,
+                    DAILY_TOTALS, WEEKLY_TOTALS, EMPLOYEE_TOTALS)
 
 messages = {
     "title_name": "Select an employee:",
-    "title_date": "Select a date:", 
+    "title_date": "Days with tasks are starred", 
     "prompt_name": "Enter your name, then press enter",
     "prompt_notes": "Enter any notes on the job. Press ctrl+d when finished.\n",
-    "prompt_duration": "Enter a duration for the job in hours (whole numbers only please)",
+    "prompt_duration": "Enter a duration for the job in minutes (whole numbers only please)",
     "prompt_search_choice": "Please enter a search option",
     "search_name": "Please enter an employee name",
-    "search_date": "Select a date range",
+    "search_date": "Select a date range: days of this month (3 or 3-10), "
+                   "dates (YYYY-MM-DD [YYYY-MM-DD]), or p/n for another month",
     "search_phrase": "Please enter a phrase you'd like to search for",
-    "search_time": "Please enter a duration in hours",
+    "search_time": "Please enter a duration in minutes, or a range such as 60-240, 240- or -30",
     "search_menu": "What would you like to search by?",
+    "report_menu": "Which report would you like?",
+    "prompt_report_choice": "Please enter a report option",
+    "report_from": "First day as YYYY-MM-DD (blank for the beginning)",
+    "report_to": "Last day as YYYY-MM-DD (blank for no end)",
+    "title_batch": "New tasks, saved together when you are done",
+    "batch_menu": "a) add a task  s) save them all  c) cancel",
 }
 
+# names listed by the employee picker at most
+NAME_SUGGESTIONS = 20
+
 templates = {
     "name": "{name}",
-    "timestamp": "{id}) {timestamp}",
     "task": """{id} {name} {timestamp}: 
 {notes}
-Duration: {duration} hours
-"""
+Duration: {minutes} minutes
+""",
+    "daily": "{day}  {name}: {hours:g} hours in {tasks} tasks, {average:g} minutes each",
+    "weekly": "week {week}  {name}: {hours:g} hours in {tasks} tasks, {average:g} minutes each",
+    "employee": "{name}: {hours:g} hours in {tasks} tasks, {average:g} minutes each",
+    "batch": "{number:>3}) {name}, {minutes} minutes: {summary}",
 }
 
 confirm_add = partial(confirmed, confirm_msg="Save task?")
-task_print = partial(list_print, item_template=templates['task'], title="")
+task_print = partial(page_print, item_template=templates['task'], title="")
 prompt_name = partial(line_input, prompt=messages["prompt_name"], name="name")
 prompt_notes = partial(multiline_input, prompt=messages["prompt_notes"], name="notes")
-prompt_duration = partial(numerical_input, prompt=messages["prompt_duration"], name="duration")
+prompt_duration = partial(numerical_input, prompt=messages["prompt_duration"], name="minutes")
+
+def found_title(count):
+    return "{} task{} found".format(count, "" if count == 1 else "s")
 
 def all_tasks():
     return []
 
 def phrase_search():
-    prompt_phrase = partial(line_input, prompt=messages["search_phrase"], name="phrase")
+    prompt_phrase = partial(text_input, prompt=messages["search_phrase"], name="phrase")
     return [clear_screen, prompt_phrase]
 
+def parse_minutes(text):
+    """turns time search input into a (shortest, longest) pair of minutes,
+    either of which may be None for an open end
+
+    >>> parse_minutes("90")
+    (90, 90)
+    >>> parse_minutes("240-")
+    (240, None)
+    >>> parse_minutes("60 - 120")
+    (60, 120)
+    """
+    minutes = re.fullmatch(r'(\d*)\s*(-?)\s*(\d*)', text.strip())
+    if not minutes or not (minutes.group(1) or minutes.group(3)):
+        raise ValueError("expected minutes or a range of minutes")
+    shortest = int(minutes.group(1)) if minutes.group(1) else None
+    longest = int(minutes.group(3)) if minutes.group(3) else None
+    if not minutes.group(2):
+        longest = shortest
+    return shortest, longest
+
 def time_search():
-    prompt_time = partial(numerical_input, prompt=messages["search_time"], name="time")
-    return [clear_screen, prompt_time]
+    prompt_time = partial(text_input, prompt=messages["search_time"], name="time")
+    return [clear_screen, print_alert, prompt_time]
 
 def name_search():
     def get_employees(*args, **kwargs):
         name = kwargs['input']['name'] if 'input' in kwargs and 'name' in kwargs['input'] else ""
-        kwargs['list'] = NAMES_MATCHING(name)
+        kwargs['list'] = NAMES_STARTING(name, limit=NAME_SUGGESTIONS)
         return kwargs
     employee_print = partial(list_print, item_template=templates['name'], title=messages['title_name'])
-    prompt_name = partial(line_input, prompt=messages["search_name"], name="name")
+    prompt_name = partial(text_input, prompt=messages["search_name"], name="name")
     return [clear_screen, print_alert, get_employees, employee_print, prompt_name]
 
+def month_calendar(year, month, days):
+    """returns a calendar of the month with the given day numbers starred"""
+    lines = [
+        "{} {}".format(calendar.month_name[month], year),
+        "".join("{:>3} ".format(name) for name in ["Mo", "Tu", "We", "Th", "Fr", "Sa", "Su"]),
+    ]
+    for week in calendar.monthcalendar(year, month):
+        lines.append("".join(
+            "{:>3}{}".format(day, "*" if day in days else " ") if day else "    " 
+            for day in week
+        ))
+    return "\n".join(lines)
+
+def parse_range(text, year, month):
+    """turns date picker input into a (start, end) pair of dates
+
+    >>> parse_range("3-5", 2019, 1)
+    (datetime.date(2019, 1, 3), datetime.date(2019, 1, 5))
+    >>> parse_range("2019-01-09", 2018, 4)
+    (datetime.date(2019, 1, 9), datetime.date(2019, 1, 9))
+    """
+    days = re.fullmatch(r'(\d{1,2})(?:\s*-\s*(\d{1,2}))?', text)
+    if days:
+        first, last = days.group(1), days.group(2) or days.group(1)
+        dates = [datetime.date(year, month, int(first)), datetime.date(year, month, int(last))]
+    else:
+        dates = [datetime.datetime.strptime(part, "%Y-%m-%d").date() for part in text.split()]
+        if len(dates) == 1:
+            dates = dates * 2
+        if len(dates) != 2:
+            raise ValueError("expected one or two dates")
+    return min(dates), max(dates)
+
+def pick_date_range(*args, **kwargs):
+    """shows one month at a time, fetching only the days shown, until the
+    user picks a range"""
+    shown = LATEST_DAY() or datetime.date.today()
+    year, month = shown.year, shown.month
+    while True:
+        if answers and answers[0].strip().lower() in ["p", "n"]:
+            answer = ask().strip().lower()
+        elif answers:
+            # a typed-ahead range needs no calendar, and may be two dates
+            answer = ask_rest().strip().lower()
+        else:
+            answer = show_month(year, month, kwargs.pop('alert', None))
+        if answer in ["p", "n"]:
+            year, month = divmod(year * 12 + month - 1 + (1 if answer == "n" else -1), 12)
+            month += 1
+        else:
+            try:
+                start, end = parse_range(answer, year, month)
+                break
+            except ValueError:
+                answers.clear()
+                kwargs['alert'] = "BAD INPUT  Please try again"
+    if "input" not in kwargs:
+        kwargs['input'] = dict()
+    kwargs['input']['from'], kwargs['input']['to'] = start, end
+    return kwargs
+
+def show_month(year, month, alert=None):
+    """draws a month's calendar with its days with tasks starred, and
+    returns the user's answer"""
+    first = datetime.date(year, month, 1)
+    last = datetime.date(year, month, calendar.monthrange(year, month)[1])
+    days = {row['day'].day for row in DAYS_WITH_TASKS(first, last)}
+    draw("\n".join(
+        (["::: {} :::".format(alert)] if alert else []) + [
+        messages['title_date'],
+        "",
+        month_calendar(year, month, days),
+        "",
+        "{} >>>  ".format(messages['search_date']),
+    ]))
+    return input().strip().lower()
+
 def date_search():
-    def get_dates(*args, **kwargs):
-        unnumbered = ALL_DATES()
-        numbered = map(lambda x: { 'id': x[0] + 1, **x[1] }, enumerate(unnumbered))
-        kwargs['list'] = list(numbered)
-        return kwargs
-    dates_print = partial(list_print, item_template=templates['timestamp'], title=messages['title_date'])
-    prompt_date = partial(numerical_input, prompt=messages["search_date"], name="date")
-    return [clear_screen, get_dates, dates_print, prompt_date]
+    return [clear_screen, pick_date_range]
 
 search_options = [
     ('a', all_tasks),
@@ -82,11 +195,97 @@ search_choice = partial(choice_menu, title=messages["search_menu"],
                         prompt=messages["prompt_search_choice"], 
                         options=search_options, name="search")
 
+def daily_report():
+    return []
+
+def weekly_report():
+    return []
+
+def employee_report():
+    return []
+
+report_options = [
+    ('d', daily_report),
+    ('w', weekly_report),
+    ('e', employee_report),
+]
+
+reports = {
+    'd': DAILY_TOTALS,
+    'w': WEEKLY_TOTALS,
+    'e': EMPLOYEE_TOTALS,
+}
+
+report_choice = partial(choice_menu, title=messages["report_menu"], 
+                        prompt=messages["prompt_report_choice"], 
+                        options=report_options, name="report")
+prompt_from = partial(date_input, prompt=messages["report_from"], name="from")
+prompt_to = partial(date_input, prompt=messages["report_to"], name="to")
+
 def add_task_func_list():
     return [clear_screen, prompt_name, prompt_notes, prompt_duration, confirm_add, "this", end]
 
+def batch_add_func_list():
+    return [clear_screen, collect_tasks, "this", end]
+
+def batch_summary(batch):
+    """returns the running list of tasks collected so far and their total"""
+    lines = [messages['title_batch'], ""] + [
+        templates['batch'].format(number=number, summary=task['notes'].split("\n")[0][:40], **task)
+        for number, task in enumerate(batch, 1)
+    ]
+    lines += ["", "{} tasks, {} minutes".format(len(batch), sum(task['minutes'] for task in batch))]
+    return "\n".join(lines)
+
+def read_task():
+    """asks for one task, raising ValueError with a message fit to show"""
+    try:
+        task = exec_funcs(func_list=[prompt_name, prompt_notes, prompt_duration])['input']
+    except ValueError:
+        raise ValueError("durations are whole minutes")
+    return clean_task(task)
+
+def collect_tasks(*args, **kwargs):
+    """gathers tasks in memory until the user saves or cancels them, leaving
+    kwargs['batch'] empty on cancel"""
+    batch = []
+    while True:
+        if not answers:
+            alert = kwargs.pop('alert', None)
+            draw("\n".join(
+                (["::: {} :::".format(alert)] if alert else []) + [
+                batch_summary(batch),
+                "",
+                "{} >>>  ".format(messages['batch_menu']),
+            ]))
+        try:
+            answer = ask().strip().lower()[:1]
+            if answer == "a":
+                clear()
+                batch.append(read_task())
+            elif answer == "s":
+                break
+            elif answer == "c":
+                batch = []
+                break
+            else:
+                answers.clear()
+                kwargs['alert'] = "BAD INPUT  Please try again"
+        except ValueError as err:
+            answers.clear()
+            kwargs['alert'] = "{}, that task was not added".format(err)
+        except KeyboardInterrupt:
+            batch = []
+            break
+    kwargs['batch'] = batch
+    return kwargs
+
 def search_tasks_func_list():
-    return [clear_screen, search_choice, "*", "this", clear_screen, task_print, pause, end]
+    return [clear_screen, search_choice, "*", "this", task_print, end]
+
+def report_tasks_func_list():
+    return [clear_screen, report_choice, "*", prompt_from, prompt_to, "this", 
+            clear_screen, list_print, pause, end]
 
 @option(chain_function=add_task_func_list)
 def add_task(*args, **kwargs):
@@ -95,10 +294,13 @@ def add_task(*args, **kwargs):
         CREATE_TASK(kwargs['input'])
     return kwargs
 
-def grab_date_helper(obj):
-    date_choice = obj['input']['date']
-    date_range = obj['list'][date_choice - 1]
-    return date_range['timestamp']
+@option(chain_function=batch_add_func_list)
+def batch_add(*args, **kwargs):
+    """add several tasks in one transaction"""
+    if kwargs['batch']:
+        # one batch, so one transaction: every task is saved or none are
+        CREATE_TASKS(kwargs['batch'], batch_size=len(kwargs['batch']))
+    return kwargs
 
 @option(chain_function=search_tasks_func_list)
 def search_tasks(*args, **kwargs):
@@ -106,38 +308,69 @@ def search_tasks(*args, **kwargs):
     choice = kwargs['input']['search']
     if choice == 'n':
         while True:
-            if 'list' in kwargs:
-                del kwargs['list']
-            matches = NAMES_MATCHING(kwargs['input']['name'])
-            if len(matches) < 1:
+            kwargs.pop('list', None)
+            name = kwargs['input']['name']
+            # at most two matches are counted, enough to tell none, one and many apart
+            exact = NAME_EXISTS(name)
+            matches = 1 if exact else COUNT_NAMES_STARTING(name, limit=2)
+            if matches == 1:
+                if not exact:
+                    name = NAMES_STARTING(name, limit=1)[0]['name']
+                query = TASKS_MATCHING(name=name, archived=True, row_type='namedtuples')
+                break
+            if not matches:
                 kwargs['alert'] = "NO MATCHES try again"
-                del kwargs['func_list']
                 del kwargs['input']['name']
-                kwargs = exec_funcs(func_list=name_search(), **kwargs)
-            elif len(matches) == 1:
-                kwargs['list'] = TASKS_WITH_NAME(kwargs['input']['name'])
+            # otherwise ask again, suggesting the names that matched
+            kwargs = exec_funcs(func_list=name_search(), **kwargs)
+            del kwargs['func_list']
+    elif choice == 't':
+        while True:
+            try:
+                shortest, longest = parse_minutes(kwargs['input']['time'])
                 break
-            else:
+            except ValueError:
+                kwargs['alert'] = "BAD INPUT  Please try again"
+                kwargs = exec_funcs(func_list=time_search(), **kwargs)
                 del kwargs['func_list']
-                kwargs = exec_funcs(func_list=name_search(), list=matches, **kwargs)
-                kwargs['list'] = TASKS_WITH_NAME(kwargs['input']['name'])
-                break
-    elif choice == 't':
-        kwargs['list'] = TASKS_WITH_DURATION(kwargs['input']['time'])
+        query = TASKS_MATCHING(shortest=shortest, longest=longest, archived=True,
+                               row_type='namedtuples')
     elif choice == 'p':
-        kwargs['list'] = TASKS_CONTAINING(kwargs['input']['phrase'])
+        query = TASKS_MATCHING(phrase=kwargs['input']['phrase'], archived=True, row_type='namedtuples')
     elif choice == 'd':
-        # we use the previous list here until I make an option picker
-        kwargs['list'] = TASKS_WITH_DATE(grab_date_helper(kwargs))
+        query = TASKS_IN_RANGE(kwargs['input']['from'], kwargs['input']['to'], row_type='namedtuples')
     elif choice == 'a':
-        kwargs['list'] = ALL_TASKS()
+        query = TASKS_MATCHING(archived=True, row_type='namedtuples')
+    # ranked results are not in id order, so they page by offset
+    kwargs['pages'] = (offset_pages if choice == 'p' else keyset_pages)(query)
+    kwargs['title'] = found_title(count_rows(query))
+    kwargs.pop('list', None)
+    return kwargs
+
+@option(chain_function=report_tasks_func_list)
+def report_tasks(*args, **kwargs):
+    """total hours from the daily totals table"""
+    choice = kwargs['input']['report']
+    report_name = get_opt_name(dict(report_options)[choice])
+    kwargs['title'] = "{} hours".format(report_name.capitalize())
+    kwargs['item_template'] = templates[report_name]
+    kwargs['list'] = reports[choice](kwargs['input']['from'], kwargs['input']['to'])
     return kwargs
 
-def run():
-    db = initialize()
+def run(database=None, backup_to=None, backup_minutes=60):
+    """runs the menu on database, work_log.db by default, backing it up to
+    backup_to every backup_minutes and on quitting when it is given"""
+    db = initialize(database, profile="performance")
+    backups = None
+    if backup_to:
+        from .backup import BackupThread
+        backups = BackupThread(db, backup_to, backup_minutes * 60)
+        backups.start()
     options = [
         ('a', add_task),
+        ('b', batch_add),
         ('s', search_tasks),
+        ('r', report_tasks),
     ]
     
     work_log = Menu(
@@ -151,6 +384,10 @@ def run():
         work_log.loop(callback=lambda func: func())
     except SystemExit as err:
         print(err)
+    finally:
+        if backups:
+            backups.stop()
+            print(backups.summary())
         db.close()
 
 